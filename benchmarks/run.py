@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+"""
+Benchmarks of the public API of django-role-permissions.
+
+Generates users, roles and permissions, then records the latency
+distribution and the number of queries of each operation as JSON:
+
+    $ python benchmarks/run.py --users 100000 --roles 200 --permissions 2000 --output 3.2.0.json
+    $ python benchmarks/run.py --compare 3.2.0.json 3.3.0.json
+
+The database is an in-memory SQLite one unless ``--db-engine`` and the
+related options point to another, e.g. PostgreSQL. Its tables are created
+by ``migrate``; use an empty database.
+"""
+from __future__ import print_function, unicode_literals
+
+import argparse
+import copy
+import io
+import json
+import os
+import platform
+import random
+import sys
+import time
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--roles', type=int, default=20)
+    parser.add_argument('--permissions', type=int, default=200)
+    parser.add_argument('--roles-per-user', type=int, default=2)
+    parser.add_argument('--permissions-per-role', type=int, default=20)
+    parser.add_argument('--iterations', type=int, default=500, help='Samples per operation')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--skip-sync-roles', action='store_true', help="Don't benchmark sync_roles")
+    parser.add_argument('--db-engine', default='django.db.backends.sqlite3')
+    parser.add_argument('--db-name', default=':memory:')
+    parser.add_argument('--db-host', default='')
+    parser.add_argument('--db-port', default='')
+    parser.add_argument('--db-user', default='')
+    parser.add_argument('--db-password', default=os.environ.get('BENCHMARK_DB_PASSWORD', ''))
+    parser.add_argument('--output', help='Write the results to this file instead of stdout')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help='Compare two result files instead of running the benchmarks')
+    return parser.parse_args(argv)
+
+
+def setup_django(args):
+    settings.configure(
+        DEBUG=False,
+        SECRET_KEY='benchmarks',
+        INSTALLED_APPS=[
+            'django.contrib.auth',
+            'django.contrib.contenttypes',
+            'rolepermissions',
+        ],
+        DATABASES={'default': {
+            'ENGINE': args.db_engine,
+            'NAME': args.db_name,
+            'HOST': args.db_host,
+            'PORT': args.db_port,
+            'USER': args.db_user,
+            'PASSWORD': args.db_password,
+        }},
+        TEMPLATES=[{'BACKEND': 'django.template.backends.django.DjangoTemplates', 'APP_DIRS': True}],
+        USE_TZ=True,
+    )
+    django.setup()
+
+
+class QueryCounter(object):
+    """Counts the queries run on a connection, with less overhead than ``CaptureQueriesContext``."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def count_queries():
+    from django.db import connection
+
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        yield counter
+
+
+def percentile(sorted_samples, fraction):
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, int(round(fraction * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def summarize(samples, queries):
+    samples = sorted(samples)
+    return {
+        'samples': len(samples),
+        'mean_ms': sum(samples) / len(samples) * 1000 if samples else 0.0,
+        'p50_ms': percentile(samples, 0.50) * 1000,
+        'p95_ms': percentile(samples, 0.95) * 1000,
+        'p99_ms': percentile(samples, 0.99) * 1000,
+        'max_ms': samples[-1] * 1000 if samples else 0.0,
+        'queries_per_op': float(queries) / len(samples) if samples else 0.0,
+    }
+
+
+def measure(operation, arguments):
+    """Call ``operation`` once per item of ``arguments`` and summarize the latencies and queries."""
+    samples = []
+    with count_queries() as counter:
+        for argument in arguments:
+            started = time.perf_counter()
+            operation(argument)
+            samples.append(time.perf_counter() - started)
+
+    return summarize(samples, counter.count)
+
+
+def make_roles(args, rng):
+    from rolepermissions.roles import AbstractUserRole
+
+    permission_names = ['bench_permission_%d' % i for i in range(args.permissions)]
+    roles = []
+    for i in range(args.roles):
+        names = rng.sample(permission_names, min(args.permissions_per_role, len(permission_names)))
+        available_permissions = dict((name, index % 2 == 0) for index, name in enumerate(names))
+        roles.append(type(str('BenchRole%d' % i), (AbstractUserRole,), {
+            '__module__': __name__,
+            'available_permissions': available_permissions,
+        }))
+
+    return roles
+
+
+def make_users(args, roles, rng):
+    from django.contrib.auth import get_user_model
+    from rolepermissions.roles import assign_role_bulk
+
+    user_model = get_user_model()
+    user_model.objects.bulk_create(
+        [user_model(username='bench_user_%d' % i) for i in range(args.users)], batch_size=1000)
+    user_pks = list(user_model.objects.order_by('pk').values_list('pk', flat=True))
+
+    users_by_role = dict((role, []) for role in roles)
+    for user_pk in user_pks:
+        for role in rng.sample(roles, min(args.roles_per_user, len(roles))):
+            users_by_role[role].append(user_pk)
+    for role, role_user_pks in users_by_role.items():
+        assign_role_bulk(role_user_pks, role)
+
+    return user_pks
+
+
+def fresh_users(user_pks, count, rng):
+    """Get ``count`` new instances of random users, with nothing loaded yet."""
+    from django.contrib.auth import get_user_model
+
+    pks = [rng.choice(user_pks) for _ in range(count)]
+    users = get_user_model().objects.in_bulk(set(pks))
+    return [copy.copy(users[pk]) for pk in pks]
+
+
+def run_benchmarks(args):
+    from django.core.management import call_command
+    from django.template import Context, Template
+    from rolepermissions.cache import get_user_snapshot
+    from rolepermissions.checkers import has_role, has_permission, has_object_permission
+    from rolepermissions.permissions import register_object_checker
+    from rolepermissions.roles import assign_role, remove_role, clear_roles
+
+    rng = random.Random(args.seed)
+    call_command('migrate', verbosity=0)
+    roles = make_roles(args, rng)
+
+    @register_object_checker('bench_checker')
+    def bench_checker(role, user, obj):
+        return obj % 2 == 0
+
+    results = {}
+    started = time.perf_counter()
+    with count_queries() as counter:
+        call_command('sync_roles', all_permissions=True, verbosity=0, stdout=io.StringIO())
+    results['sync_roles'] = summarize([time.perf_counter() - started], counter.count)
+
+    started = time.perf_counter()
+    user_pks = make_users(args, roles, rng)
+    setup_seconds = time.perf_counter() - started
+
+    iterations = args.iterations
+    role_names = [role.get_name() for role in roles]
+    permission_names = ['bench_permission_%d' % i for i in range(args.permissions)]
+
+    def pairs(values):
+        return list(zip(fresh_users(user_pks, iterations, rng), [rng.choice(values) for _ in range(iterations)]))
+
+    results['has_role'] = measure(lambda pair: has_role(pair[0], pair[1]), pairs(role_names))
+    results['has_permission'] = measure(lambda pair: has_permission(pair[0], pair[1]), pairs(permission_names))
+    results['has_object_permission'] = measure(
+        lambda pair: has_object_permission('bench_checker', pair[0], pair[1]), pairs(range(100)))
+
+    warm_user = fresh_users(user_pks, 1, rng)[0]
+    get_user_snapshot(warm_user)
+    results['has_role_warm'] = measure(
+        lambda role: has_role(warm_user, role), [rng.choice(role_names) for _ in range(iterations)])
+    results['has_permission_warm'] = measure(
+        lambda name: has_permission(warm_user, name), [rng.choice(permission_names) for _ in range(iterations)])
+
+    template = Template(
+        '{% load permission_tags %}'
+        + ''.join('{%% if user|has_role:"%s" %%}r{%% endif %%}{%% if user|can:"%s" %%}p{%% endif %%}'
+                  % (rng.choice(role_names), rng.choice(permission_names)) for _ in range(20)))
+    results['template_filters'] = measure(
+        lambda user: template.render(Context({'user': user})), fresh_users(user_pks, iterations, rng))
+
+    role_pairs = pairs(roles)
+    results['assign_role'] = measure(lambda pair: assign_role(pair[0], pair[1]), role_pairs)
+    results['remove_role'] = measure(lambda pair: remove_role(pair[0], pair[1]), role_pairs)
+    results['clear_roles'] = measure(clear_roles, fresh_users(user_pks, iterations, rng))
+
+    if not args.skip_sync_roles:
+        started = time.perf_counter()
+        with count_queries() as counter:
+            call_command('sync_roles', reset_user_permissions=True, verbosity=0, stdout=io.StringIO())
+        results['sync_roles_reset_user_permissions'] = summarize([time.perf_counter() - started], counter.count)
+
+    return {
+        'meta': {
+            'rolepermissions': __import__('rolepermissions').__version__,
+            'django': django.get_version(),
+            'python': platform.python_version(),
+            'database': args.db_engine.rsplit('.', 1)[-1],
+            'users': args.users,
+            'roles': args.roles,
+            'permissions': args.permissions,
+            'roles_per_user': args.roles_per_user,
+            'permissions_per_role': args.permissions_per_role,
+            'iterations': iterations,
+            'seed': args.seed,
+            'setup_seconds': setup_seconds,
+            'timestamp': int(time.time()),
+        },
+        'results': results,
+    }
+
+
+def compare(baseline_path, current_path):
+    with open(baseline_path) as baseline_file, open(current_path) as current_file:
+        baseline = json.load(baseline_file)['results']
+        current = json.load(current_file)['results']
+
+    print('%-36s %12s %12s %8s %14s' % ('operation', 'p50 before', 'p50 after', 'ratio', 'queries/op'))
+    for name in sorted(set(baseline) | set(current)):
+        before, after = baseline.get(name), current.get(name)
+        if before is None or after is None:
+            print('%-36s %s' % (name, 'only in ' + (current_path if before is None else baseline_path)))
+            continue
+        ratio = after['p50_ms'] / before['p50_ms'] if before['p50_ms'] else float('inf')
+        print('%-36s %10.3fms %10.3fms %7.2fx %6.1f -> %-6.1f' % (
+            name, before['p50_ms'], after['p50_ms'], ratio, before['queries_per_op'], after['queries_per_op']))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    setup_django(args)
+    report = json.dumps(run_benchmarks(args), indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(report + '\n')
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
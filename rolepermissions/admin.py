@@ -1,6 +1,5 @@
 from django.conf import settings
 from django.contrib import admin, auth
-from django.contrib.auth.models import Group
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.admin.sites import NotRegistered
 from rolepermissions import roles
@@ -19,11 +18,9 @@ class RolePermissionsUserAdminMixin(object):
         new_user_groups = set(g.name for g in user.groups.all())
 
         for role_name in (old_user_roles - new_user_groups):  # roles removed from User's groups
-            try:  # put the recently removed group back, let rolepermissions remove it...
-                group = Group.objects.get(name=role_name)
-                user.groups.add(group)
-            except Group.DoesNotExist:
-                pass
+            # put the recently removed group back, let rolepermissions remove it...
+            group, _created = roles.retrieve_role(role_name).get_or_create_group()
+            user.groups.add(group)
             roles.remove_role(user, role_name)
 
         for group_name in (new_user_groups - old_user_roles):  # groups potentially added to User's roles
@@ -10,3 +10,6 @@ class RolePermissions(AppConfig):
 
     def ready(self):
         load_roles_and_permissions()
+
+        from rolepermissions.signals import connect_signals
+        connect_signals()
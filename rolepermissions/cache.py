@@ -0,0 +1,513 @@
+from __future__ import unicode_literals
+
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import transaction
+from django.db.models import CharField, Value
+
+from rolepermissions.profiling import _tracked
+
+
+SNAPSHOT_ATTR = '_rolepermissions_snapshot'
+MEMO_ATTR = '_rolepermissions_checker_memo'
+
+CACHE_KEY_PREFIX = 'rolepermissions'
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 0.05
+LOCK_RETRIES = 20
+
+_stats = {'hits': 0, 'misses': 0}
+_memo_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+_NO_CACHE_OVERRIDE = object()
+_cache_alias = ContextVar('rolepermissions_cache_alias', default=_NO_CACHE_OVERRIDE)
+
+
+class InstanceCache(object):
+    """
+    Process-wide cache of model instances by name.
+
+    Instances read inside a transaction are only stored once it commits,
+    so rows that get rolled back never end up in the cache.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._instances = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get_many(self, names):
+        """Get a dict of the cached instances and a list of the missing names."""
+        instances = self._instances
+        found = {}
+        missing = []
+        for name in names:
+            instance = instances.get(name)
+            if instance is None:
+                missing.append(name)
+            else:
+                found[name] = instance
+
+        return found, missing
+
+    def add_many(self, instances, loaded=False, using=None):
+        """
+        Store instances by name. ``loaded`` tells the instances are the
+        result of loading everything that is expected to be used.
+        """
+        generation = self._generation
+
+        def store():
+            with self._lock:
+                if generation != self._generation:  # cleared since the instances were read
+                    return
+                self._instances.update(instances)
+                self.loaded = self.loaded or loaded
+
+        transaction.on_commit(store, using=using)
+
+    def clear(self):
+        with self._lock:
+            self._instances = {}
+            self.loaded = False
+            self._generation += 1
+
+
+permission_cache = InstanceCache()
+group_cache = InstanceCache()
+
+
+class UserSnapshot(object):
+    """
+    Roles of a user and the bitmask of their effective permissions
+    (see :py:attr:`RoleRegistry.permission_bits`).
+
+    ``permission_mask`` can also be a function computing the mask, which is
+    only called the first time the mask is read, so that role checks don't
+    load the permissions.
+    """
+
+    __slots__ = ('roles', '_permission_mask')
+
+    def __init__(self, roles, permission_mask):
+        self.roles = roles
+        self._permission_mask = permission_mask
+
+    @property
+    def loaded(self):
+        return not callable(self._permission_mask)
+
+    @_tracked
+    def load(self):
+        if callable(self._permission_mask):
+            self._permission_mask = self._permission_mask()
+
+        return self
+
+    @property
+    def permission_mask(self):
+        if callable(self._permission_mask):
+            self.load()
+
+        return self._permission_mask
+
+    @property
+    def permission_names(self):
+        from rolepermissions.roles import RolesManager
+
+        return RolesManager.get_registry().permission_names_from_mask(self.permission_mask)
+
+
+EMPTY_SNAPSHOT = UserSnapshot([], 0)
+
+
+class LazyUserSnapshot(object):
+    """
+    Snapshot that is only loaded, with a single query, the first time its
+    roles or permissions are used. See :py:mod:`rolepermissions.middleware`.
+    """
+
+    def __init__(self, user):
+        self._user = user
+        self._snapshot = None
+
+    @property
+    def loaded(self):
+        return self._snapshot is not None
+
+    @_tracked
+    def load(self):
+        if self._snapshot is None:
+            user = self._user
+            cache = get_cache()
+            if cache is not None:
+                self._snapshot = _get_cached_snapshot(cache, user, load_user_snapshot)
+            else:
+                self._snapshot = load_user_snapshot(user)
+            self._user = None
+
+        return self._snapshot
+
+    @property
+    def roles(self):
+        return self.load().roles
+
+    @property
+    def permission_mask(self):
+        return self.load().permission_mask
+
+    @property
+    def permission_names(self):
+        return self.load().permission_names
+
+
+def build_user_snapshot(user):
+    """
+    Compute a snapshot of a user's roles and permissions from the database.
+    The permissions are only queried when they are first used.
+    """
+    from rolepermissions.roles import RolesManager, get_user_roles
+    from rolepermissions.permissions import _available_perm_names
+
+    roles = get_user_roles(user)
+    registry = RolesManager.get_registry()
+    return UserSnapshot(roles, lambda: registry.mask(_available_perm_names(user, roles)))
+
+
+async def abuild_user_snapshot(user):
+    """Async version of :py:func:`build_user_snapshot`, using the async ORM."""
+    from rolepermissions.roles import RolesManager, aget_user_roles
+    from rolepermissions.permissions import _aavailable_perm_names
+
+    roles = await aget_user_roles(user)
+    mask = RolesManager.get_registry().mask(await _aavailable_perm_names(user, roles))
+    return UserSnapshot(roles, mask)
+
+
+def load_user_snapshot(user):
+    """Compute a snapshot of a user's roles and permissions with a single query."""
+    return load_user_snapshots([user.pk])[user.pk]
+
+
+@_tracked
+def get_user_snapshot(user):
+    """
+    Get the snapshot of a user's roles and permissions.
+
+    The snapshot is computed on first use and attached to the user instance,
+    so it lives as long as the instance does (usually a single request).
+    When ``ROLEPERMISSIONS_CACHE`` is set, snapshots are also shared across
+    requests through that cache.
+    """
+    if not user:
+        return EMPTY_SNAPSHOT
+
+    snapshot = getattr(user, SNAPSHOT_ATTR, None)
+    if snapshot is None:
+        cache = get_cache()
+        if cache is not None and user.pk is not None:
+            snapshot = _get_cached_snapshot(cache, user)
+        else:
+            snapshot = build_user_snapshot(user)
+        setattr(user, SNAPSHOT_ATTR, snapshot)
+
+    return snapshot
+
+
+@_tracked
+async def aget_user_snapshot(user):
+    """
+    Async version of :py:func:`get_user_snapshot`. Snapshots are built with
+    the async ORM; going through ``ROLEPERMISSIONS_CACHE`` still happens in
+    a thread.
+    """
+    if not user:
+        return EMPTY_SNAPSHOT
+
+    snapshot = getattr(user, SNAPSHOT_ATTR, None)
+    if snapshot is not None and not snapshot.loaded:
+        await sync_to_async(snapshot.load)()
+    elif snapshot is None:
+        if get_cache() is not None and user.pk is not None:
+            return await sync_to_async(get_user_snapshot)(user)
+
+        snapshot = await abuild_user_snapshot(user)
+        setattr(user, SNAPSHOT_ATTR, snapshot)
+
+    return snapshot
+
+
+def prefetch_role_data(users):
+    """
+    Load the roles and permissions of many users at once and attach a
+    snapshot to each of them, so checkers don't query the database for any
+    of these users. ``users`` can be a queryset or a list of users.
+
+    :returns: the list of users.
+    """
+    users = list(users)
+    user_pks = [user.pk for user in users if user.pk is not None]
+    if not user_pks:
+        return users
+
+    snapshots = load_user_snapshots(user_pks)
+    for user in users:
+        setattr(user, SNAPSHOT_ATTR, snapshots.get(user.pk, EMPTY_SNAPSHOT))
+
+    return users
+
+
+def load_user_snapshots(user_pks):
+    """
+    Compute the snapshots of the given users with a single query, which
+    reads their role groups and their permissions together.
+
+    :returns: a dict of user primary keys to snapshots.
+    """
+    from rolepermissions.roles import RolesManager, _get_user_throughs
+
+    registry = RolesManager.get_registry()
+    (group_through, group_user_field, group_field), \
+        (permission_through, permission_user_field, permission_field) = _get_user_throughs()
+    group_name = '%s__name' % group_through._meta.get_field(group_field).name
+    codename = '%s__codename' % permission_through._meta.get_field(permission_field).name
+
+    groups = group_through.objects.filter(**{
+        '%s__in' % group_user_field: user_pks, '%s__in' % group_name: list(registry.roles),
+    }).annotate(rolepermissions_kind=Value('role', output_field=CharField())).values_list(
+        group_user_field, 'rolepermissions_kind', group_name)
+    permissions = permission_through.objects.filter(**{
+        '%s__in' % permission_user_field: user_pks, '%s__in' % codename: list(registry.permission_bits),
+    }).annotate(rolepermissions_kind=Value('permission', output_field=CharField())).values_list(
+        permission_user_field, 'rolepermissions_kind', codename)
+
+    roles_by_user = {}
+    mask_by_user = {}
+    for user_pk, kind, name in groups.union(permissions, all=True):
+        if kind == 'role':
+            roles_by_user.setdefault(user_pk, []).append(registry.roles[name])
+        else:
+            mask_by_user[user_pk] = mask_by_user.get(user_pk, 0) | registry.permission_bits[name]
+
+    snapshots = {}
+    for user_pk in user_pks:
+        roles = sorted(roles_by_user.get(user_pk, []), key=registry.names.__getitem__)
+        scope = 0
+        for role in roles:
+            scope |= registry.role_masks[role]
+        snapshots[user_pk] = UserSnapshot(roles, mask_by_user.get(user_pk, 0) & scope)
+
+    return snapshots
+
+
+def invalidate_user_snapshot(user):
+    """
+    Drop the snapshot attached to a user instance, if any, and the one
+    stored in the cache.
+    """
+    if not user:
+        return
+
+    drop_user_snapshot(user)
+    if user.pk is not None:
+        bump_user_versions([user.pk], using=user._state.db)
+
+
+def drop_user_snapshot(user):
+    """Drop the snapshot and memoized checks attached to a user instance, if any."""
+    for attr in (SNAPSHOT_ATTR, MEMO_ATTR):
+        if getattr(user, attr, None) is not None:
+            delattr(user, attr)
+
+
+def memoize_check(user, key, check):
+    """
+    Get the result of an object check memoized on a user instance, calling
+    ``check`` to compute it the first time. Like the snapshot, the memo
+    lives as long as the instance does.
+    """
+    memo = getattr(user, MEMO_ATTR, None)
+    if memo is None:
+        memo = {}
+        setattr(user, MEMO_ATTR, memo)
+
+    if key in memo:
+        _increment_stat('hits', _memo_stats)
+        return memo[key]
+
+    _increment_stat('misses', _memo_stats)
+    result = memo[key] = check()
+    return result
+
+
+def get_cache():
+    """Get the cache configured by ``ROLEPERMISSIONS_CACHE``, or by :py:func:`using_cache`, or ``None``."""
+    alias = _cache_alias.get()
+    if alias is _NO_CACHE_OVERRIDE:
+        alias = getattr(settings, 'ROLEPERMISSIONS_CACHE', None)
+    if alias is None:
+        return None
+
+    return caches[alias]
+
+
+@contextmanager
+def using_cache(alias):
+    """
+    Share snapshots through the ``alias`` cache, or through none when it is
+    ``None``, instead of ``ROLEPERMISSIONS_CACHE``, in the current thread or
+    task only. Settings are left untouched.
+    """
+    token = _cache_alias.set(alias)
+    try:
+        yield
+    finally:
+        _cache_alias.reset(token)
+
+
+def get_cache_stats():
+    """Get the hit and miss counters of the snapshot cache."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        for key in _stats:
+            _stats[key] = 0
+
+
+def get_memo_stats():
+    """Get the hit and miss counters of memoized object checks."""
+    with _stats_lock:
+        return dict(_memo_stats)
+
+
+def reset_memo_stats():
+    with _stats_lock:
+        for key in _memo_stats:
+            _memo_stats[key] = 0
+
+
+def bump_user_versions(user_pks, using=None):
+    """
+    Invalidate the cached snapshots of the given users.
+
+    Each user has a version token which is part of its snapshot key, so
+    replacing the token makes the stored snapshot unreachable. The token is
+    replaced again when the current transaction commits, in case a snapshot
+    was cached from another connection in the meantime.
+    """
+    cache = get_cache()
+    if cache is None or not user_pks:
+        return
+
+    def bump():
+        cache.set_many(dict((_version_key(pk), _new_version()) for pk in user_pks), None)
+
+    bump()
+    if transaction.get_connection(using).in_atomic_block:
+        transaction.on_commit(bump, using=using)
+
+
+def _increment_stat(name, stats=_stats):
+    with _stats_lock:
+        stats[name] += 1
+
+
+def _new_version():
+    return uuid.uuid4().hex
+
+
+def _version_key(user_pk):
+    return '%s:version:%s' % (CACHE_KEY_PREFIX, user_pk)
+
+
+def _snapshot_key(user_pk, version):
+    from rolepermissions.roles import RolesManager
+
+    fingerprint = RolesManager.get_registry().fingerprint
+    return '%s:snapshot:%s:%s:%s' % (CACHE_KEY_PREFIX, fingerprint, user_pk, version)
+
+
+def _get_version(cache, user_pk):
+    key = _version_key(user_pk)
+    version = cache.get(key)
+    if version is None:
+        version = _new_version()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+
+    return version
+
+
+def _snapshot_to_data(snapshot):
+    return (tuple(role.get_name() for role in snapshot.roles), snapshot.permission_mask)
+
+
+def _snapshot_from_data(data):
+    from rolepermissions.roles import RolesManager
+
+    role_names, permission_mask = data
+    roles = [RolesManager.retrieve_role(name) for name in role_names]
+    return UserSnapshot([role for role in roles if role], permission_mask)
+
+
+def _get_cached_snapshot(cache, user, build=build_user_snapshot):
+    key = _snapshot_key(user.pk, _get_version(cache, user.pk))
+
+    data = cache.get(key)
+    if data is not None:
+        _increment_stat('hits')
+        return _snapshot_from_data(data)
+
+    _increment_stat('misses')
+
+    # The snapshot of a transaction is only shared once it commits, so nobody should wait for it meanwhile.
+    using = user._state.db
+    if transaction.get_connection(using).in_atomic_block:
+        snapshot = build(user)
+        _store_snapshot(cache, key, snapshot, using)
+        return snapshot
+
+    # Only one process rebuilds a missing snapshot, the others wait for it.
+    lock_key = '%s:lock' % key
+    if cache.add(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            snapshot = build(user)
+        except Exception:
+            cache.delete(lock_key)
+            raise
+        _store_snapshot(cache, key, snapshot, using, lock_key)
+        return snapshot
+
+    for _ in range(LOCK_RETRIES):
+        time.sleep(LOCK_WAIT)
+        data = cache.get(key)
+        if data is not None:
+            return _snapshot_from_data(data)
+
+    return build(user)
+
+
+def _store_snapshot(cache, key, snapshot, using, lock_key=None):
+    timeout = getattr(settings, 'ROLEPERMISSIONS_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+    data = _snapshot_to_data(snapshot)
+
+    def store():
+        cache.set(key, data, timeout)
+        if lock_key is not None:
+            cache.delete(lock_key)
+
+    # The snapshot may reflect uncommitted changes, only share it once they are committed.
+    transaction.on_commit(store, using=using)
@@ -1,14 +1,18 @@
 from __future__ import unicode_literals
 
 import inspect
+from collections.abc import Mapping
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from rolepermissions.roles import (
-    RolesManager, get_user_roles)
-from rolepermissions.permissions import (
-    PermissionsManager, available_perm_names)
+from django.db.models import Q
+from rolepermissions.roles import RolesManager
+from rolepermissions.permissions import PermissionsManager
+from rolepermissions.cache import get_user_snapshot, aget_user_snapshot, memoize_check
+from rolepermissions.profiling import _tracked
 
 
+@_tracked
 def has_role(user, roles):
     """Check if a user has any of the given roles."""
     if _check_superpowers(user):
@@ -24,31 +28,252 @@ def has_role(user, roles):
 
         normalized_roles.append(role)
 
-    user_roles = get_user_roles(user)
+    user_roles = get_user_snapshot(user).roles
 
     return any([role in user_roles for role in normalized_roles])
 
 
+@_tracked
 def has_permission(user, permission_name):
     """Check if a user has a given permission."""
     if _check_superpowers(user):
         return True
 
-    return permission_name in available_perm_names(user)
+    bit = RolesManager.get_registry().permission_bits.get(permission_name)
+    if bit is None:
+        return False
+
+    return bool(get_user_snapshot(user).permission_mask & bit)
+
+
+@_tracked
+def has_any_permission(user, permission_names):
+    """Check if a user has any of the given permissions."""
+    if _check_superpowers(user):
+        return True
 
+    mask = RolesManager.get_registry().mask(permission_names)
+    if not mask:
+        return False
+
+    return bool(get_user_snapshot(user).permission_mask & mask)
+
+
+@_tracked
+def has_all_permissions(user, permission_names):
+    """Check if a user has all of the given permissions."""
+    if _check_superpowers(user):
+        return True
 
+    registry = RolesManager.get_registry()
+    if any(permission_name not in registry.permission_bits for permission_name in permission_names):
+        return False
+
+    mask = registry.mask(permission_names)
+    return get_user_snapshot(user).permission_mask & mask == mask
+
+
+@_tracked
 def has_object_permission(checker_name, user, obj):
     """Check if a user has permission to perform an action on an object."""
     if _check_superpowers(user):
         return True
 
+    if (checker_name not in PermissionsManager.get_checkers()
+            and PermissionsManager.retrieve_batch_checker(checker_name) is not None):
+        return _evaluate_object_checker(checker_name, user, [obj])[0]
+
     checker = PermissionsManager.retrieve_checker(checker_name)
-    user_roles = get_user_roles(user)
+    user_roles = get_user_snapshot(user).roles
 
     if not user_roles:
         user_roles = [None]
 
-    return any([checker(user_role, user, obj) for user_role in user_roles])
+    return _check_object(checker_name, checker, user, user_roles, obj)
+
+
+@_tracked
+async def ahas_role(user, roles):
+    """Async version of :py:func:`has_role`."""
+    if _check_superpowers(user):
+        return True
+
+    await aget_user_snapshot(user)
+    return has_role(user, roles)
+
+
+@_tracked
+async def ahas_permission(user, permission_name):
+    """Async version of :py:func:`has_permission`."""
+    if _check_superpowers(user):
+        return True
+
+    await aget_user_snapshot(user)
+    return has_permission(user, permission_name)
+
+
+@_tracked
+async def ahas_any_permission(user, permission_names):
+    """Async version of :py:func:`has_any_permission`."""
+    if _check_superpowers(user):
+        return True
+
+    await aget_user_snapshot(user)
+    return has_any_permission(user, permission_names)
+
+
+@_tracked
+async def ahas_all_permissions(user, permission_names):
+    """Async version of :py:func:`has_all_permissions`."""
+    if _check_superpowers(user):
+        return True
+
+    await aget_user_snapshot(user)
+    return has_all_permissions(user, permission_names)
+
+
+@_tracked
+async def ahas_object_permission(checker_name, user, obj):
+    """
+    Async version of :py:func:`has_object_permission`. Checkers are regular
+    functions, so they run in a thread.
+    """
+    if _check_superpowers(user):
+        return True
+
+    await aget_user_snapshot(user)
+    return await sync_to_async(has_object_permission)(checker_name, user, obj)
+
+
+class ObjectPermissionMap(Mapping):
+    """
+    Map of objects to whether a user passes an object checker for them.
+
+    Objects that can't be hashed, like dicts or unsaved model instances, are
+    looked up by identity, so they must be the same objects that were checked.
+    """
+
+    def __init__(self, checker_name, items=()):
+        self.checker_name = checker_name
+        self._objects = {}
+        self._allowed = {}
+        for obj, allowed in items:
+            key = _object_key(obj)
+            self._objects[key] = obj
+            self._allowed[key] = allowed
+
+    def __getitem__(self, obj):
+        return self._allowed[_object_key(obj)]
+
+    def __iter__(self):
+        return iter(self._objects.values())
+
+    def __len__(self):
+        return len(self._allowed)
+
+    def __repr__(self):
+        return '<ObjectPermissionMap %s: %d objects>' % (self.checker_name, len(self))
+
+
+def _object_key(obj):
+    try:
+        hash(obj)
+    except TypeError:
+        # The map keeps a reference to the object, so its id is not reused.
+        return (False, id(obj))
+
+    return (True, obj)
+
+
+@_tracked
+def object_permission_map(checker_name, user, objects):
+    """
+    Check if a user has permission to perform an action on each of the given
+    objects. The user's roles are resolved once for all of them.
+
+    :returns: an :py:class:`ObjectPermissionMap` of objects to booleans.
+    """
+    objects = list(objects)
+    return ObjectPermissionMap(checker_name, zip(objects, _evaluate_object_checker(checker_name, user, objects)))
+
+
+@_tracked
+def filter_objects_by_permission(checker_name, user, objects):
+    """Get the list of objects a user has permission to perform an action on."""
+    objects = list(objects)
+    return [obj for obj, allowed in zip(objects, _evaluate_object_checker(checker_name, user, objects)) if allowed]
+
+
+@_tracked
+def filter_queryset_by_permission(checker_name, user, queryset):
+    """
+    Filter a queryset down to the objects a user has permission on, in the
+    database, using the queryset form of a checker.
+    """
+    if _check_superpowers(user):
+        return queryset
+
+    checker = PermissionsManager.retrieve_queryset_checker(checker_name)
+    user_roles = get_user_snapshot(user).roles or [None]
+
+    conditions = None
+    for user_role in user_roles:
+        condition = checker(user_role, user)
+        if condition is True:
+            return queryset
+        if not isinstance(condition, Q):
+            continue
+
+        conditions = condition if conditions is None else conditions | condition
+
+    if conditions is None:
+        return queryset.none()
+
+    return queryset.filter(conditions)
+
+
+def _evaluate_object_checker(checker_name, user, objects):
+    if _check_superpowers(user):
+        return [True] * len(objects)
+
+    batch_checker = PermissionsManager.retrieve_batch_checker(checker_name)
+    checker = None if batch_checker else PermissionsManager.retrieve_checker(checker_name)
+    user_roles = get_user_snapshot(user).roles or [None]
+
+    if checker is not None:
+        return [_check_object(checker_name, checker, user, user_roles, obj) for obj in objects]
+
+    results = [False] * len(objects)
+    for user_role in user_roles:
+        pending = [index for index, allowed in enumerate(results) if not allowed]
+        if not pending:
+            break
+
+        allowed = batch_checker(user_role, user, [objects[index] for index in pending])
+        for index, is_allowed in zip(pending, allowed):
+            results[index] = bool(is_allowed)
+
+    return results
+
+
+def _check_object(checker_name, checker, user, user_roles, obj):
+    def check():
+        return any(checker(user_role, user, obj) for user_role in user_roles)
+
+    key = _memo_key(checker_name, user, obj) if PermissionsManager.is_memoized(checker_name) else None
+    if key is None:
+        return check()
+
+    return memoize_check(user, key, check)
+
+
+def _memo_key(checker_name, user, obj):
+    """Key of an object check, or ``None`` if it can't be memoized."""
+    meta = getattr(obj, '_meta', None)
+    if not user or user.pk is None or meta is None or obj.pk is None:
+        return None
+
+    return (checker_name, user.pk, meta.label_lower, obj.pk)
 
 
 def _check_superpowers(user):
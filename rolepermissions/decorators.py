@@ -1,42 +1,132 @@
 from __future__ import unicode_literals
 
+import asyncio
 from functools import wraps
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.contrib.auth.views import redirect_to_login as dj_redirect_to_login
 from django.core.exceptions import PermissionDenied
-from django.shortcuts import redirect as dj_redirect
 
-from rolepermissions.checkers import has_role, has_permission
+from rolepermissions.roles import RolesManager, _get_role_class
+from rolepermissions.checkers import has_permission, _check_superpowers
+from rolepermissions.cache import get_user_snapshot, aget_user_snapshot
 from rolepermissions.utils import user_is_authenticated
 
 
-def _role_permission_checker(function, subject, redirect_to_login, redirect_url):
-    def request_decorator(dispatch):
-        @wraps(dispatch)
+class AccessPolicy(object):
+    """
+    Access check compiled once, when a view is decorated or a view class is
+    created, so that requests only run the check itself. It is also the
+    decorator of the view.
+    """
+
+    def __init__(self, redirect_to_login=None, redirect_url=None):
+        self.redirect_to_login = redirect_to_login
+        self.redirect_url = redirect_url
+
+    def check(self, user):
+        raise NotImplementedError
+
+    async def acheck(self, user):
+        await aget_user_snapshot(user)
+        return self.check(user)
+
+    def __call__(self, view):
+        if asyncio.iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                return await self.adispatch(view, request, *args, **kwargs)
+            return async_wrapper
+
+        @wraps(view)
         def wrapper(request, *args, **kwargs):
-            user = request.user
-            if user_is_authenticated(user):
-                if function(user, subject):
-                    return dispatch(request, *args, **kwargs)
-
-            if redirect_url:
-                return dj_redirect(redirect_url)
-
-            redirect = redirect_to_login
-            if redirect is None:
-                redirect = getattr(
-                    settings, 'ROLEPERMISSIONS_REDIRECT_TO_LOGIN', False)
-            if redirect:
-                return dj_redirect_to_login(request.get_full_path())
-            raise PermissionDenied
+            return self.dispatch(view, request, *args, **kwargs)
         return wrapper
-    return request_decorator
+
+    def dispatch(self, view, request, *args, **kwargs):
+        user = request.user
+        if user_is_authenticated(user):
+            if self.check(user):
+                return view(request, *args, **kwargs)
+
+        return self.deny(request)
+
+    async def adispatch(self, view, request, *args, **kwargs):
+        user = await _aget_user(request)
+        if user_is_authenticated(user):
+            if await self.acheck(user):
+                return await view(request, *args, **kwargs)
+
+        return self.deny(request)
+
+    def deny(self, request):
+        # Imported here, they pull in the forms and templates machinery.
+        from django.contrib.auth.views import redirect_to_login as dj_redirect_to_login
+        from django.shortcuts import redirect as dj_redirect
+
+        if self.redirect_url:
+            return dj_redirect(self.redirect_url)
+
+        redirect = self.redirect_to_login
+        if redirect is None:
+            redirect = getattr(
+                settings, 'ROLEPERMISSIONS_REDIRECT_TO_LOGIN', False)
+        if redirect:
+            return dj_redirect_to_login(request.get_full_path())
+        raise PermissionDenied
+
+
+class RolePolicy(AccessPolicy):
+    """Grants access to users with any of the given roles."""
+
+    def __init__(self, roles, redirect_to_login=None, redirect_url=None):
+        super(RolePolicy, self).__init__(redirect_to_login, redirect_url)
+        if not isinstance(roles, list):
+            roles = [roles]
+        self.roles = frozenset(_get_role_class(role) for role in roles)
+
+    def check(self, user):
+        if _check_superpowers(user):
+            return True
+
+        return not self.roles.isdisjoint(get_user_snapshot(user).roles)
+
+
+class PermissionPolicy(AccessPolicy):
+    """Grants access to users with the given permission."""
+
+    def __init__(self, permission_name, redirect_to_login=None, redirect_url=None):
+        super(PermissionPolicy, self).__init__(redirect_to_login, redirect_url)
+        self.permission_name = permission_name
+        self.bit = RolesManager.get_registry().permission_bits.get(permission_name)
+
+    def check(self, user):
+        if self.bit is None:  # not registered by any role yet
+            return has_permission(user, self.permission_name)
+
+        if _check_superpowers(user):
+            return True
+
+        return bool(get_user_snapshot(user).permission_mask & self.bit)
+
+
+async def _aget_user(request):
+    if hasattr(request, 'auser'):
+        return await request.auser()
+
+    # request.user is loaded lazily by the authentication middleware, with the sync ORM.
+    return await sync_to_async(_get_user)(request)
+
+
+def _get_user(request):
+    user = request.user
+    user_is_authenticated(user)
+    return user
 
 
 def has_role_decorator(role, redirect_to_login=None, redirect_url=None):
-    return _role_permission_checker(has_role, role, redirect_to_login, redirect_url)
+    return RolePolicy(role, redirect_to_login, redirect_url)
 
 
 def has_permission_decorator(permission_name, redirect_to_login=None, redirect_url=None):
-    return _role_permission_checker(has_permission, permission_name, redirect_to_login, redirect_url)
+    return PermissionPolicy(permission_name, redirect_to_login, redirect_url)
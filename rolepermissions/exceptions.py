@@ -11,3 +11,7 @@ class RoleDoesNotExist(Exception):
 
 class RolePermissionScopeException(Exception):
     pass
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
@@ -1,32 +1,55 @@
 from __future__ import unicode_literals
 
-import inspect
+import time
 
 from importlib import import_module
-from pydoc import locate
 
+from django.apps import apps
 from django.conf import settings
+from django.utils.module_loading import module_has_submodule
 
 
-def get_app_name(app_name):
+_import_timings = []
+
+
+def discover_modules():
     """
-    Returns a app name from new app config if is
-    a class or the same app name if is not a class.
+    Find the modules that define roles and object checkers:
+    ``ROLEPERMISSIONS_MODULE`` and the ``permissions`` module of each
+    installed app that has one.
     """
-    type_ = locate(app_name)
-    if inspect.isclass(type_):
-        return type_.name
-    return app_name
+    modules = []
+    if hasattr(settings, 'ROLEPERMISSIONS_MODULE'):
+        modules.append(settings.ROLEPERMISSIONS_MODULE)
+
+    for app_config in apps.get_app_configs():
+        if app_config.name != 'rolepermissions' and module_has_submodule(app_config.module, 'permissions'):
+            modules.append('%s.permissions' % app_config.name)
+
+    return modules
+
+
+def get_modules():
+    """Get the modules to load, from ``ROLEPERMISSIONS_MODULES`` if it is set, or else discovered."""
+    modules = getattr(settings, 'ROLEPERMISSIONS_MODULES', None)
+    if modules is None:
+        modules = discover_modules()
+
+    return list(modules)
+
+
+def get_import_timings():
+    """Get ``(module, seconds)`` for each module imported by the last :py:func:`load_roles_and_permissions`."""
+    return list(_import_timings)
 
 
 def load_roles_and_permissions():
-    if hasattr(settings, 'ROLEPERMISSIONS_MODULE'):
-        import_module(settings.ROLEPERMISSIONS_MODULE)
-
-    for app_name in settings.INSTALLED_APPS:
-        if app_name != 'rolepermissions':
-            app_name = get_app_name(app_name)
-            try:
-                import_module('.permissions', app_name)
-            except ImportError:
-                pass
+    timings = []
+    for module in get_modules():
+        started = time.perf_counter()
+        import_module(module)
+        timings.append((module, time.perf_counter() - started))
+    _import_timings[:] = timings
+
+    from rolepermissions.roles import RolesManager
+    RolesManager.get_registry()
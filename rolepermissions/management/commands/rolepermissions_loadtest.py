@@ -0,0 +1,247 @@
+import copy
+import json
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+
+from rolepermissions import roles
+from rolepermissions.cache import SNAPSHOT_ATTR, LazyUserSnapshot, using_cache
+from rolepermissions.checkers import has_role, has_permission, has_object_permission
+from rolepermissions.permissions import PermissionsManager
+
+SYNTHETIC_USERNAME_PREFIX = 'rolepermissions_loadtest_'
+DEFAULT_MIX = 'has_role=50,has_permission=40,has_object_permission=10'
+OPERATIONS = ('has_role', 'has_permission', 'has_object_permission', 'mutation')
+
+
+def parse_mix(value):
+    """Parse ``operation=weight,...`` into a list of ``(operation, weight)``."""
+    mix = []
+    for item in value.split(','):
+        operation, _, weight = item.partition('=')
+        operation = operation.strip()
+        if operation not in OPERATIONS:
+            raise CommandError("Unknown operation %r, expected one of %s." % (operation, ', '.join(OPERATIONS)))
+        try:
+            mix.append((operation, int(weight)))
+        except ValueError:
+            raise CommandError("The weight of %s must be an integer." % operation)
+
+    return [(operation, weight) for operation, weight in mix if weight > 0]
+
+
+def percentile(sorted_samples, fraction):
+    if not sorted_samples:
+        return 0.0
+    return sorted_samples[min(len(sorted_samples) - 1, int(round(fraction * (len(sorted_samples) - 1))))]
+
+
+class _QueryCounter(object):
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _run_operation(user, operation, argument, users, checker_name):
+    if operation == 'has_role':
+        has_role(user, argument)
+    elif operation == 'has_permission':
+        has_permission(user, argument)
+    elif operation == 'has_object_permission':
+        has_object_permission(checker_name, user, users[argument])
+    elif argument in roles.get_user_roles(user):
+        roles.remove_role(user, argument)
+        roles.assign_role(user, argument)
+    else:
+        roles.assign_role(user, argument)
+        roles.remove_role(user, argument)
+
+
+def _run_requests(requests, users, scenario, checker_name, cache_alias):
+    """
+    Replay requests in the current thread, sharing snapshots through the
+    ``cache_alias`` cache if any; get the latency of each operation, the
+    number of queries and the number of database errors.
+    """
+    samples = []
+    errors = 0
+    counter = _QueryCounter()
+    try:
+        with using_cache(cache_alias), connection.execute_wrapper(counter):
+            for user_pk, operations in requests:
+                user = copy.copy(users[user_pk])
+                if scenario == 'lazy':
+                    setattr(user, SNAPSHOT_ATTR, LazyUserSnapshot(user))
+
+                for operation, argument in operations:
+                    if scenario == 'uncached':
+                        user = copy.copy(users[user_pk])
+
+                    started = time.perf_counter()
+                    try:
+                        _run_operation(user, operation, argument, users, checker_name)
+                    except DatabaseError:
+                        errors += 1
+                        continue
+                    samples.append(time.perf_counter() - started)
+    finally:
+        if threading.current_thread() is not threading.main_thread():
+            connection.close()
+
+    return samples, counter.count, errors
+
+
+class Command(BaseCommand):
+    help = ("Replay a mix of role and permission checks across threads and report throughput, latency "
+            "percentiles and queries per operation, with and without caching.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100, help='Number of existing users to sample')
+        parser.add_argument('--synthetic', type=int, default=0,
+                            help='Create this many users with random roles instead, and delete them afterwards')
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--operations', type=int, default=10000, help='Operations per scenario')
+        parser.add_argument('--checks_per_request', type=int, default=10,
+                            help='Operations made on the same user instance, like in a request')
+        parser.add_argument('--mix', default=DEFAULT_MIX,
+                            help='Weights of %s; mutation needs --synthetic' % ', '.join(OPERATIONS))
+        parser.add_argument('--checker', help='Object checker for has_object_permission, called with other users')
+        parser.add_argument('--cache', help='Cache alias for the shared cache scenario')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        mix = parse_mix(options['mix'])
+        if options['checker'] is None:
+            mix = [(operation, weight) for operation, weight in mix if operation != 'has_object_permission']
+        elif options['checker'] not in PermissionsManager.get_checkers():
+            raise CommandError("Object checker %r is not registered." % options['checker'])
+        if not options['synthetic'] and any(operation == 'mutation' for operation, _weight in mix):
+            raise CommandError("Role mutations are only replayed on --synthetic users.")
+        if not mix:
+            raise CommandError("The operation mix is empty.")
+
+        registry = roles.RolesManager.get_registry()
+        if not registry.roles:
+            raise CommandError("No roles are registered.")
+
+        synthetic_pks = self.create_synthetic_users(options['synthetic'], rng) if options['synthetic'] else []
+        try:
+            user_pks = synthetic_pks or list(
+                get_user_model().objects.order_by('?').values_list('pk', flat=True)[:options['users']])
+            if not user_pks:
+                raise CommandError("There are no users to sample.")
+
+            requests = self.plan_requests(user_pks, mix, registry, options, rng)
+            scenarios = ['uncached', 'request', 'lazy']
+            if options['cache']:
+                scenarios.append('shared_cache')
+
+            results = dict(
+                (scenario, self.run_scenario(scenario, requests, user_pks, options)) for scenario in scenarios)
+        finally:
+            if synthetic_pks:
+                get_user_model().objects.filter(pk__in=synthetic_pks).delete()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2, sort_keys=True))
+        else:
+            self.write_table(results, len(user_pks), options)
+
+    def create_synthetic_users(self, count, rng):
+        user_model = get_user_model()
+        prefix = '%s%s_' % (SYNTHETIC_USERNAME_PREFIX, uuid.uuid4().hex[:8])
+        user_model.objects.bulk_create(
+            [user_model(**{user_model.USERNAME_FIELD: '%s%d' % (prefix, i)}) for i in range(count)])
+        user_pks = list(user_model.objects.filter(**{
+            '%s__startswith' % user_model.USERNAME_FIELD: prefix,
+        }).values_list('pk', flat=True))
+
+        role_classes = list(roles.RolesManager.get_registry().roles.values())
+        for role in role_classes:
+            roles.assign_role_bulk([pk for pk in user_pks if rng.random() < 2.0 / len(role_classes)], role)
+
+        return user_pks
+
+    def plan_requests(self, user_pks, mix, registry, options, rng):
+        """Draw the requests replayed by every scenario: a user and the operations made on it."""
+        role_names = list(registry.roles)
+        role_classes = list(registry.roles.values())
+        permission_names = list(registry.permission_bits)
+        operations, weights = zip(*mix)
+
+        requests = []
+        remaining = options['operations']
+        while remaining > 0:
+            size = min(remaining, max(1, options['checks_per_request']))
+            request = []
+            for operation in rng.choices(operations, weights, k=size):
+                if operation == 'has_role':
+                    argument = rng.choice(role_names)
+                elif operation == 'has_permission':
+                    argument = rng.choice(permission_names) if permission_names else ''
+                elif operation == 'has_object_permission':
+                    argument = rng.choice(user_pks)
+                else:
+                    argument = rng.choice(role_classes)
+                request.append((operation, argument))
+            requests.append((rng.choice(user_pks), request))
+            remaining -= size
+
+        return requests
+
+    def run_scenario(self, scenario, requests, user_pks, options):
+        users = get_user_model().objects.in_bulk(user_pks)
+        threads = max(1, options['threads'])
+        # Each user belongs to one thread, so the role mutations of a user never race
+        thread_of_user = dict((pk, index % threads) for index, pk in enumerate(user_pks))
+        shards = [[] for _ in range(threads)]
+        for request in requests:
+            shards[thread_of_user[request[0]]].append(request)
+        cache_alias = options['cache'] if scenario == 'shared_cache' else None
+
+        started = time.perf_counter()
+        if threads == 1:
+            outcomes = [_run_requests(shards[0], users, scenario, options['checker'], cache_alias)]
+        else:
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                outcomes = list(executor.map(
+                    lambda shard: _run_requests(shard, users, scenario, options['checker'], cache_alias), shards))
+        elapsed = time.perf_counter() - started
+
+        samples = sorted(sample for outcome in outcomes for sample in outcome[0])
+        queries = sum(outcome[1] for outcome in outcomes)
+        return {
+            'operations': len(samples),
+            'errors': sum(outcome[2] for outcome in outcomes),
+            'threads': threads,
+            'ops_per_second': len(samples) / elapsed if elapsed else 0.0,
+            'p50_ms': percentile(samples, 0.50) * 1000,
+            'p95_ms': percentile(samples, 0.95) * 1000,
+            'p99_ms': percentile(samples, 0.99) * 1000,
+            'queries_per_op': float(queries) / len(samples) if samples else 0.0,
+        }
+
+    def write_table(self, results, user_count, options):
+        self.stdout.write("%d users, %d threads, %d operations per scenario, mix: %s" % (
+            user_count, max(1, options['threads']), options['operations'], options['mix']))
+        self.stdout.write("%-14s %12s %10s %10s %10s %12s %8s" % (
+            'scenario', 'ops/s', 'p50 ms', 'p95 ms', 'p99 ms', 'queries/op', 'errors'))
+        for scenario, result in results.items():
+            self.stdout.write("%-14s %12.0f %10.3f %10.3f %10.3f %12.2f %8d" % (
+                scenario, result['ops_per_second'], result['p50_ms'], result['p95_ms'], result['p99_ms'],
+                result['queries_per_op'], result['errors']))
+        if getattr(settings, 'ROLEPERMISSIONS_CACHE', None) and not options['cache']:
+            self.stdout.write("Pass --cache %s to also measure the shared cache." % settings.ROLEPERMISSIONS_CACHE)
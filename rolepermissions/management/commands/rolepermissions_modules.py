@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from rolepermissions import loader
+
+
+class Command(BaseCommand):
+    help = ("Show how long it took to import the modules that define roles and object checkers, and print "
+            "a ROLEPERMISSIONS_MODULES setting that imports only the modules that exist.")
+
+    def handle(self, *args, **options):
+        timings = loader.get_import_timings()
+        total = sum(elapsed for _module, elapsed in timings)
+        self.stdout.write("Imported %d modules in %.1fms:" % (len(timings), total * 1000))
+        for module, elapsed in sorted(timings, key=lambda timing: -timing[1]):
+            self.stdout.write("  %8.1fms  %s" % (elapsed * 1000, module))
+
+        self.stdout.write("")
+        self.stdout.write("ROLEPERMISSIONS_MODULES = [")
+        for module in loader.discover_modules():
+            self.stdout.write("    %r," % module)
+        self.stdout.write("]")
@@ -1,7 +1,104 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth import get_user_model
+from django.db import connections
+from django.db.models import Max, Min
 from rolepermissions import roles
+from rolepermissions.cache import bump_user_versions
+
+
+def get_default_permission_ids_by_group():
+    """Map the group of each registered role to the primary keys of the role's default permissions."""
+    registry = roles.RolesManager.get_registry()
+    role_group_ids = roles._get_role_group_ids(registry)
+    permission_ids = roles._get_permission_ids(
+        set().union(*[registry.default_true_permissions[role] for role in role_group_ids]))
+
+    return dict(
+        (group_id, [permission_ids[name] for name in registry.default_true_permissions[role]
+                    if name in permission_ids])
+        for role, group_id in role_group_ids.items())
+
+
+def reset_user_permissions(user_pks, permission_ids_by_group):
+    """
+    Re-apply the default permissions of the roles of the given users.
+
+    This is what clearing and re-assigning every role of each user amounts
+    to: groups are left as they are and the default permissions of the
+    user's roles are added back. Permissions are never removed.
+    """
+    (group_through, group_user_field, group_field), \
+        (permission_through, permission_user_field, permission_field) = roles._get_user_throughs()
+
+    memberships = group_through.objects.filter(**{
+        '%s__in' % group_user_field: user_pks,
+        '%s__in' % group_field: list(permission_ids_by_group),
+    }).values_list(group_user_field, group_field)
+
+    permission_through.objects.bulk_create(
+        [permission_through(**{permission_user_field: user_pk, permission_field: permission_id})
+         for user_pk, group_id in memberships for permission_id in permission_ids_by_group[group_id]],
+        ignore_conflicts=True)
+    bump_user_versions(user_pks)
+
+
+def reset_user_permissions_range(batch_size, after_pk=None, last_pk=None, progress=None):
+    """
+    Reset the permissions of the users with a primary key greater than
+    ``after_pk`` and up to ``last_pk``, ``batch_size`` users at a time.
+    ``progress`` is called with the number of users done and the last
+    primary key after each batch.
+
+    :returns: the number of users done.
+    """
+    permission_ids_by_group = get_default_permission_ids_by_group()
+    users = get_user_model().objects.order_by('pk').values_list('pk', flat=True)
+    if last_pk is not None:
+        users = users.filter(pk__lte=last_pk)
+
+    count = 0
+    while True:
+        chunk = users if after_pk is None else users.filter(pk__gt=after_pk)
+        user_pks = list(chunk[:batch_size])
+        if not user_pks:
+            break
+
+        reset_user_permissions(user_pks, permission_ids_by_group)
+        count += len(user_pks)
+        after_pk = user_pks[-1]
+        if progress is not None:
+            progress(count, after_pk)
+
+    return count
+
+
+def split_pk_range(first_pk, last_pk, shards):
+    """
+    Split the integer primary keys from ``first_pk`` to ``last_pk`` into
+    at most ``shards`` disjoint ``(after_pk, last_pk)`` ranges.
+    """
+    size = -(-(last_pk - first_pk + 1) // shards)  # ceil
+    return [(after_pk, min(after_pk + size, last_pk))
+            for after_pk in range(first_pk - 1, last_pk, size)]
+
+
+def _init_worker():
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+    connections.close_all()
+
+
+def _reset_shard(batch_size, after_pk, last_pk):
+    started = time.time()
+    count = reset_user_permissions_range(batch_size, after_pk, last_pk)
+    return count, time.time() - started
 
 
 class Command(BaseCommand):
@@ -28,6 +125,26 @@ class Command(BaseCommand):
             default=False,
             help='Create all new permissions instead of only permissions with default true',
         )
+        parser.add_argument(
+            '--batch_size',
+            type=int,
+            dest='batch_size',
+            default=roles.BULK_BATCH_SIZE,
+            help='Number of users handled at a time by --reset_user_permissions',
+        )
+        parser.add_argument(
+            '--jobs',
+            type=int,
+            dest='jobs',
+            default=1,
+            help='Number of worker processes used by --reset_user_permissions (needs integer primary keys)',
+        )
+        parser.add_argument(
+            '--start_pk',
+            dest='start_pk',
+            default=None,
+            help='Resume --reset_user_permissions after the User with this primary key',
+        )
 
     def handle(self, *args, **options):
         # Sync auth.Group with current registered roles (leaving existing groups intact!)
@@ -44,9 +161,51 @@ class Command(BaseCommand):
         if options.get('reset_user_permissions', False):  # dj1.7 compat
             # Push any permission changes made to roles and remove any unregistered roles from all auth.Users
             self.stdout.write("Resetting permissions for ALL Users to defaults defined by roles.")
+            batch_size = options.get('batch_size') or roles.BULK_BATCH_SIZE
+            start_pk = options.get('start_pk')
+            started = time.time()
+            if options.get('jobs', 1) > 1:
+                count = self.reset_user_permissions_in_parallel(options['jobs'], batch_size, start_pk)
+            else:
+                count = reset_user_permissions_range(batch_size, start_pk, progress=self.progress_writer(options))
+            self.write_throughput("Reset %d Users" % count, count, time.time() - started)
+
+    def progress_writer(self, options):
+        if options.get('verbosity', 1) < 1:
+            return None
+
+        def progress(count, last_pk):
+            self.stdout.write("Reset %d Users, last pk: %s" % (count, last_pk))
+        return progress
+
+    def write_throughput(self, message, count, elapsed):
+        self.stdout.write("%s in %.1fs (%.0f users/s)." % (message, elapsed, count / elapsed if elapsed else 0))
+
+    def reset_user_permissions_in_parallel(self, jobs, batch_size, start_pk):
+        users = get_user_model().objects.all()
+        if start_pk is not None:
+            users = users.filter(pk__gt=start_pk)
+        bounds = users.aggregate(first_pk=Min('pk'), last_pk=Max('pk'))
+        if bounds['first_pk'] is None:
+            return 0
+        if not isinstance(bounds['first_pk'], int):
+            raise CommandError("--jobs requires integer primary keys.")
+
+        shards = split_pk_range(bounds['first_pk'], bounds['last_pk'], jobs)
+        # Workers must not share the connection of this process.
+        connections.close_all()
+
+        count = 0
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker) as executor:
+            futures = dict(
+                (executor.submit(_reset_shard, batch_size, after_pk, last_pk), (after_pk, last_pk))
+                for after_pk, last_pk in shards)
+            for future in as_completed(futures):
+                after_pk, last_pk = futures[future]
+                shard_count, elapsed = future.result()
+                count += shard_count
+                self.write_throughput(
+                    "Shard of pks %s to %s: reset %d Users" % (after_pk + 1, last_pk, shard_count),
+                    shard_count, elapsed)
 
-            for user in get_user_model().objects.all():
-                user_roles = roles.get_user_roles(user=user)
-                roles.clear_roles(user=user)
-                for role in user_roles:
-                    roles.assign_role(user=user, role=role)
+        return count
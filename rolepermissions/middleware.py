@@ -0,0 +1,85 @@
+from __future__ import unicode_literals
+
+import asyncio
+import logging
+
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+from django.utils.functional import SimpleLazyObject
+
+from rolepermissions.cache import SNAPSHOT_ATTR, LazyUserSnapshot
+from rolepermissions.profiling import track_permission_checks
+
+
+logger = logging.getLogger('rolepermissions')
+
+
+def _attach_lazy_snapshot(user):
+    if user and user.pk is not None and getattr(user, SNAPSHOT_ATTR, None) is None:
+        setattr(user, SNAPSHOT_ATTR, LazyUserSnapshot(user))
+    return user
+
+
+def _wrap_request_user(request):
+    if hasattr(request, 'user'):
+        user = request.user
+        request.user = SimpleLazyObject(lambda: _attach_lazy_snapshot(user))
+
+
+@sync_and_async_middleware
+def RolePermissionsMiddleware(get_response):
+    """
+    Load the roles and permissions of ``request.user`` with a single query,
+    the first time any of them is checked, and share them with every other
+    check made during the request. Requests that check nothing don't query
+    anything. Goes after ``AuthenticationMiddleware``.
+    """
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            _wrap_request_user(request)
+            return await get_response(request)
+    else:
+        def middleware(request):
+            _wrap_request_user(request)
+            return get_response(request)
+
+    return middleware
+
+
+def _log_permission_checks(request, tracker):
+    if not tracker.calls:
+        return
+
+    max_queries = getattr(settings, 'ROLEPERMISSIONS_TRACKING_MAX_QUERIES', None)
+    over_budget = max_queries is not None and tracker.query_count > max_queries
+    level = logging.WARNING if over_budget or tracker.n_plus_one() else logging.DEBUG
+    if logger.isEnabledFor(level):
+        logger.log(level, '%s %s: %s', request.method, request.path, tracker.summary())
+
+
+@sync_and_async_middleware
+def PermissionCheckTrackingMiddleware(get_response):
+    """
+    Record the permission checks of every request with
+    :py:func:`rolepermissions.profiling.track_permission_checks`, in
+    ``request.permission_checks``, and log their summary to the
+    ``rolepermissions`` logger. The summary is a warning when it shows N+1
+    patterns or more queries than ``ROLEPERMISSIONS_TRACKING_MAX_QUERIES``.
+    Meant for development and profiling, not for every production request.
+    """
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            with track_permission_checks() as tracker:
+                request.permission_checks = tracker
+                response = await get_response(request)
+            _log_permission_checks(request, tracker)
+            return response
+    else:
+        def middleware(request):
+            with track_permission_checks() as tracker:
+                request.permission_checks = tracker
+                response = get_response(request)
+            _log_permission_checks(request, tracker)
+            return response
+
+    return middleware
@@ -1,25 +1,53 @@
 from __future__ import unicode_literals
 
-from rolepermissions.decorators import has_permission_decorator, has_role_decorator
+from rolepermissions.decorators import PermissionPolicy, RolePolicy
+
+
+def _dispatch(view, policy, dispatch, request, *args, **kwargs):
+    # Class based views can only be async on Django 4.1+, which is when View.view_is_async was added.
+    if getattr(view, 'view_is_async', False):
+        return policy.adispatch(dispatch, request, *args, **kwargs)
+    return policy.dispatch(dispatch, request, *args, **kwargs)
 
 
 class HasRoleMixin(object):
     allowed_roles = []
     redirect_to_login = None
+    redirect_url = None
+
+    def __init_subclass__(cls, **kwargs):
+        # Compile the policy once per class; unknown roles fail here instead of on the first request.
+        super(HasRoleMixin, cls).__init_subclass__(**kwargs)
+        cls._role_policy_source = (cls.allowed_roles, cls.redirect_to_login, cls.redirect_url)
+        cls._role_policy = RolePolicy(*cls._role_policy_source)
+
+    def get_role_policy(self):
+        source = (self.allowed_roles, self.redirect_to_login, self.redirect_url)
+        if source == self._role_policy_source:
+            return self._role_policy
+        return RolePolicy(*source)  # attributes passed to as_view()
 
     def dispatch(self, request, *args, **kwargs):
-        roles = self.allowed_roles
-        return (has_role_decorator(roles, redirect_to_login=self.redirect_to_login)
-                (super(HasRoleMixin, self).dispatch)
-                (request, *args, **kwargs))
+        return _dispatch(self, self.get_role_policy(), super(HasRoleMixin, self).dispatch,
+                         request, *args, **kwargs)
 
 
 class HasPermissionsMixin(object):
     required_permission = ''
     redirect_to_login = None
+    redirect_url = None
+
+    def __init_subclass__(cls, **kwargs):
+        super(HasPermissionsMixin, cls).__init_subclass__(**kwargs)
+        cls._permission_policy_source = (cls.required_permission, cls.redirect_to_login, cls.redirect_url)
+        cls._permission_policy = PermissionPolicy(*cls._permission_policy_source)
+
+    def get_permission_policy(self):
+        source = (self.required_permission, self.redirect_to_login, self.redirect_url)
+        if source == self._permission_policy_source:
+            return self._permission_policy
+        return PermissionPolicy(*source)  # attributes passed to as_view()
 
     def dispatch(self, request, *args, **kwargs):
-        permission = self.required_permission
-        return (has_permission_decorator(permission, redirect_to_login=self.redirect_to_login)
-                (super(HasPermissionsMixin, self).dispatch)
-                (request, *args, **kwargs))
+        return _dispatch(self, self.get_permission_policy(), super(HasPermissionsMixin, self).dispatch,
+                         request, *args, **kwargs)
@@ -1,16 +1,37 @@
 from __future__ import unicode_literals
 
+from asgiref.sync import sync_to_async
+
 from rolepermissions.exceptions import (
     RolePermissionScopeException, CheckerNotRegistered)
-from rolepermissions.roles import get_user_roles, get_or_create_permission
+from rolepermissions.roles import RolesManager, get_user_roles, aget_user_roles, _get_permissions
+from rolepermissions.roles import get_or_create_permission  # noqa: F401 (kept importable from here)
+from rolepermissions.cache import invalidate_user_snapshot
+from rolepermissions.utils import alist
+from rolepermissions.profiling import _tracked
 
 
 class PermissionsManager(object):
     _checkers = {}
+    _batch_checkers = {}
+    _queryset_checkers = {}
+    _memoized_checkers = set()
 
     @classmethod
-    def register_checker(cls, name, function):
+    def register_checker(cls, name, function, memoize=False):
         cls._checkers[name] = function
+        if memoize:
+            cls._memoized_checkers.add(name)
+        else:
+            cls._memoized_checkers.discard(name)
+
+    @classmethod
+    def register_batch_checker(cls, name, function):
+        cls._batch_checkers[name] = function
+
+    @classmethod
+    def register_queryset_checker(cls, name, function):
+        cls._queryset_checkers[name] = function
 
     @classmethod
     def get_checkers(cls):
@@ -23,20 +44,63 @@ class PermissionsManager(object):
 
         raise CheckerNotRegistered('Checker with name %s was not registered' % checker_name)
 
+    @classmethod
+    def is_memoized(cls, checker_name):
+        return checker_name in cls._memoized_checkers
+
+    @classmethod
+    def retrieve_batch_checker(cls, checker_name):
+        """Get the batch form of a checker, or ``None`` if it has none."""
+        return cls._batch_checkers.get(checker_name)
+
+    @classmethod
+    def retrieve_queryset_checker(cls, checker_name):
+        if checker_name in cls._queryset_checkers:
+            return cls._queryset_checkers[checker_name]
+
+        raise CheckerNotRegistered('Queryset checker with name %s was not registered' % checker_name)
+
+
+def register_object_checker(name=None, memoize=False):
+    """
+    Register an object checker. With ``memoize``, its result for a user and
+    an object is remembered on the user instance for the rest of the request.
+    """
+    def fuction_decorator(func):
+        checker_name = name if name else func.__name__
+        PermissionsManager.register_checker(checker_name, func, memoize)
+        return func
+    return fuction_decorator
+
+
+def register_batch_object_checker(name=None):
+    """
+    Register the batch form of an object checker. The function receives a
+    role, a user and a list of objects, and returns one boolean per object.
+    """
+    def fuction_decorator(func):
+        checker_name = name if name else func.__name__
+        PermissionsManager.register_batch_checker(checker_name, func)
+        return func
+    return fuction_decorator
+
 
-def register_object_checker(name=None):
+def register_queryset_checker(name=None):
+    """
+    Register the queryset form of an object checker. The function receives
+    a role and a user, and returns a ``Q`` object matching the objects the
+    user has permission on, ``True`` for all of them or ``False`` for none.
+    """
     def fuction_decorator(func):
         checker_name = name if name else func.__name__
-        PermissionsManager.register_checker(checker_name, func)
+        PermissionsManager.register_queryset_checker(checker_name, func)
         return func
     return fuction_decorator
 
 
 def get_permission(permission_name):
     """Get a Permission object from a permission name."""
-    permission, created = get_or_create_permission(permission_name)
-
-    return permission
+    return _get_permissions([permission_name])[permission_name]
 
 
 def available_perm_status(user):
@@ -44,13 +108,14 @@ def available_perm_status(user):
     Get a boolean map of the permissions available to a user
     based on that user's roles.
     """
+    registry = RolesManager.get_registry()
     roles = get_user_roles(user)
     permission_hash = {}
 
     user_permission_names = set(user.user_permissions.values_list("codename", flat=True))
 
     for role in roles:
-        for permission_name in role.permission_names_list():
+        for permission_name in registry.permissions[role]:
             permission_hash[permission_name] = permission_name in user_permission_names
 
     return permission_hash
@@ -64,12 +129,38 @@ def available_perm_names(user):
        Query efficient; especially when prefetch_related('group', 'user_permissions') on user object.
        No side-effects; permissions are not created in DB as side-effect.
     """
-    roles = get_user_roles(user)
-    perm_names = set(p for role in roles for p in role.permission_names_list())
-    return [p.codename for p in user.user_permissions.all() if p.codename in perm_names] \
-                                                                        if roles else []  # e.g., user == None
+    return _available_perm_names(user, get_user_roles(user))
+
+
+async def aavailable_perm_names(user):
+    """Async version of :py:func:`available_perm_names`."""
+    return await _aavailable_perm_names(user, await aget_user_roles(user))
+
+
+def _available_perm_names(user, roles):
+    if not roles:  # e.g., user == None
+        return []
+
+    return _in_roles_scope([p.codename for p in user.user_permissions.all()], roles)
+
+
+async def _aavailable_perm_names(user, roles):
+    if not roles:
+        return []
+
+    return _in_roles_scope([p.codename for p in await alist(user.user_permissions.all())], roles)
+
 
+def _in_roles_scope(permission_names, roles):
+    roles_with_permission = RolesManager.get_registry().roles_with_permission
+    return [name for name in permission_names if not roles_with_permission(name).isdisjoint(roles)]
 
+
+def _in_user_roles_scope(roles, permission_name):
+    return not RolesManager.get_registry().roles_with_permission(permission_name).isdisjoint(roles)
+
+
+@_tracked
 def grant_permission(user, permission_name):
     """
     Grant a user a specified permission.
@@ -78,19 +169,18 @@ def grant_permission(user, permission_name):
     user's roles. If the permission is out of scope,
     a RolePermissionScopeException is raised.
     """
-    roles = get_user_roles(user)
-
-    for role in roles:
-        if permission_name in role.permission_names_list():
-            permission = get_permission(permission_name)
-            user.user_permissions.add(permission)
-            return
+    if _in_user_roles_scope(get_user_roles(user), permission_name):
+        permission = get_permission(permission_name)
+        user.user_permissions.add(permission)
+        invalidate_user_snapshot(user)
+        return
 
     raise RolePermissionScopeException(
         "This permission isn't in the scope of "
         "any of this user's roles.")
 
 
+@_tracked
 def revoke_permission(user, permission_name):
     """
     Revoke a specified permission from a user.
@@ -99,14 +189,24 @@ def revoke_permission(user, permission_name):
     roles. If the permission is out of scope, a RolePermissionScopeException
     is raised.
     """
-    roles = get_user_roles(user)
-
-    for role in roles:
-        if permission_name in role.permission_names_list():
-            permission = get_permission(permission_name)
-            user.user_permissions.remove(permission)
-            return
+    if _in_user_roles_scope(get_user_roles(user), permission_name):
+        permission = get_permission(permission_name)
+        user.user_permissions.remove(permission)
+        invalidate_user_snapshot(user)
+        return
 
     raise RolePermissionScopeException(
         "This permission isn't in the scope of "
         "any of this user's roles.")
+
+
+@_tracked
+async def agrant_permission(user, permission_name):
+    """Async version of :py:func:`grant_permission`."""
+    return await sync_to_async(grant_permission)(user, permission_name)
+
+
+@_tracked
+async def arevoke_permission(user, permission_name):
+    """Async version of :py:func:`revoke_permission`."""
+    return await sync_to_async(revoke_permission)(user, permission_name)
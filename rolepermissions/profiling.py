@@ -0,0 +1,251 @@
+from __future__ import unicode_literals
+
+import functools
+import inspect
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import connection
+
+from rolepermissions.exceptions import QueryBudgetExceeded
+
+
+N_PLUS_ONE_THRESHOLD = 3
+
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__)) + os.sep
+_state = ContextVar('rolepermissions_tracking', default=None)
+
+
+class PermissionCheck(object):
+    """A call to one of the tracked functions, with the queries it made."""
+
+    __slots__ = ('function', 'args', 'kwargs', 'caller', 'queries', 'duration')
+
+    def __init__(self, function, args, kwargs, caller):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.caller = caller
+        self.queries = []
+        self.duration = 0.0
+
+    @property
+    def key(self):
+        """Identify calls made with the same arguments."""
+        return (self.function, tuple(_describe(arg) for arg in self.args),
+                tuple(sorted((name, _describe(value)) for name, value in self.kwargs.items())))
+
+    def __str__(self):
+        function, args, kwargs = self.key
+        return '%s(%s)' % (function, ', '.join(list(args) + ['%s=%s' % item for item in kwargs]))
+
+    def __repr__(self):
+        return '<PermissionCheck %s: %d queries, %.3fms>' % (self, len(self.queries), self.duration * 1000)
+
+
+class PermissionCheckTracker(object):
+    """
+    Records the calls to the checkers, to the functions that change roles
+    and permissions and the snapshot loads, while it is entered. See
+    :py:func:`track_permission_checks`.
+    """
+
+    def __init__(self, max_queries=None, n_plus_one_threshold=N_PLUS_ONE_THRESHOLD):
+        self.max_queries = max_queries
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.calls = []
+        self.total_queries = 0
+        self.duration = 0.0
+        self._wrapped_threads = set()
+        self._started = None
+        self._token = None
+        self._query_wrapper = None
+
+    def __enter__(self):
+        self._token = _state.set((self, None))
+        self._wrapped_threads.add(threading.get_ident())
+        self._query_wrapper = connection.execute_wrapper(self._count_query)
+        self._query_wrapper.__enter__()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.duration = time.perf_counter() - self._started
+        self._query_wrapper.__exit__(exc_type, exc_value, traceback)
+        self._wrapped_threads.discard(threading.get_ident())
+        _state.reset(self._token)
+
+        if exc_type is None and self.max_queries is not None and self.query_count > self.max_queries:
+            raise QueryBudgetExceeded("%d queries made by rolepermissions, the budget is %d.\n%s" % (
+                self.query_count, self.max_queries, self.summary()))
+
+    @property
+    def query_count(self):
+        """Number of queries made by the tracked calls."""
+        return sum(len(call.queries) for call in self.calls)
+
+    def duplicates(self):
+        """Get ``(call, count)`` for the calls made more than once with the same arguments."""
+        groups = OrderedDict()
+        for call in self.calls:
+            groups.setdefault(call.key, []).append(call)
+
+        return [(calls[0], len(calls)) for calls in groups.values() if len(calls) > 1]
+
+    def n_plus_one(self):
+        """
+        Get ``(function, caller, count, queries)`` for each line of code
+        that called a tracked function at least ``n_plus_one_threshold``
+        times, with every call making queries.
+        """
+        groups = OrderedDict()
+        for call in self.calls:
+            groups.setdefault((call.function, call.caller), []).append(call)
+
+        return [(function, caller, len(calls), sum(len(call.queries) for call in calls))
+                for (function, caller), calls in groups.items()
+                if len(calls) >= self.n_plus_one_threshold and all(call.queries for call in calls)]
+
+    def summary(self):
+        """Describe the calls per function, the duplicated calls and the N+1 patterns."""
+        lines = ['%d permission checks made %d of %d queries in %.1fms' % (
+            len(self.calls), self.query_count, self.total_queries, sum(call.duration for call in self.calls) * 1000)]
+
+        functions = OrderedDict()
+        for call in self.calls:
+            stats = functions.setdefault(call.function, [0, 0, 0.0])
+            stats[0] += 1
+            stats[1] += len(call.queries)
+            stats[2] += call.duration
+        for function, (count, queries, duration) in functions.items():
+            lines.append('  %-30s %5d calls %5d queries %9.3fms' % (function, count, queries, duration * 1000))
+
+        duplicates = self.duplicates()
+        if duplicates:
+            lines.append('Duplicated checks:')
+            lines.extend('  %4dx %s' % (count, call) for call, count in duplicates)
+
+        patterns = self.n_plus_one()
+        if patterns:
+            lines.append('N+1 patterns:')
+            for function, (filename, line, caller_function), count, queries in patterns:
+                lines.append('  %4dx %s from %s:%d in %s (%d queries)' % (
+                    count, function, filename, line, caller_function, queries))
+
+        return '\n'.join(lines)
+
+    def _count_query(self, execute, sql, params, many, context):
+        self.total_queries += 1
+        state = _state.get()
+        if state is not None and state[0] is self and state[1] is not None:
+            state[1].queries.append(sql)
+        return execute(sql, params, many, context)
+
+    @contextmanager
+    def _counting_queries(self):
+        """Count the queries of the current thread, e.g. of a worker thread of ``sync_to_async``."""
+        thread = threading.get_ident()
+        if thread in self._wrapped_threads:
+            yield
+            return
+
+        self._wrapped_threads.add(thread)
+        try:
+            with connection.execute_wrapper(self._count_query):
+                yield
+        finally:
+            self._wrapped_threads.discard(thread)
+
+    def _start(self, function, args, kwargs):
+        call = PermissionCheck(function.__qualname__, args, kwargs, _get_caller())
+        self.calls.append(call)
+        return call
+
+
+def track_permission_checks(max_queries=None, n_plus_one_threshold=N_PLUS_ONE_THRESHOLD):
+    """
+    Record every call to the checkers and to the functions that change
+    roles and permissions made inside a ``with`` block, with its
+    arguments, duration, queries and the line of code that made it.
+
+    Calls made by other tracked functions count as part of the outermost
+    one. With ``max_queries``, leaving the block raises
+    :py:class:`rolepermissions.exceptions.QueryBudgetExceeded` when the
+    tracked calls made more queries.
+    """
+    return PermissionCheckTracker(max_queries, n_plus_one_threshold)
+
+
+def _tracked(function):
+    """Record the calls to ``function`` while a tracker is entered."""
+    if inspect.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def async_wrapper(*args, **kwargs):
+            state = _state.get()
+            if state is None or state[1] is not None:
+                return await function(*args, **kwargs)
+
+            tracker = state[0]
+            call = tracker._start(function, args, kwargs)
+            token = _state.set((tracker, call))
+            started = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                call.duration = time.perf_counter() - started
+                _state.reset(token)
+
+        return async_wrapper
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        state = _state.get()
+        if state is None:
+            return function(*args, **kwargs)
+
+        tracker, call = state
+        with tracker._counting_queries():
+            if call is not None:
+                return function(*args, **kwargs)
+
+            call = tracker._start(function, args, kwargs)
+            token = _state.set((tracker, call))
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                call.duration = time.perf_counter() - started
+                _state.reset(token)
+
+    return wrapper
+
+
+def _get_caller():
+    """Get ``(filename, line, function)`` of the first frame outside of rolepermissions."""
+    frame = sys._getframe(2)
+    while frame is not None and frame.f_code.co_filename.startswith(_PACKAGE_DIR):
+        frame = frame.f_back
+    if frame is None:
+        return ('', 0, '')
+
+    return (frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name)
+
+
+def _describe(value):
+    """Describe an argument without evaluating it, e.g. without running the query of a QuerySet."""
+    if value is None or isinstance(value, (str, int, float)):
+        return repr(value)
+    if inspect.isclass(value):
+        return value.__name__
+    if isinstance(value, (list, tuple)):
+        return '[%s]' % ', '.join(_describe(item) for item in value)
+    meta = getattr(value, '_meta', None)
+    if meta is not None and hasattr(value, 'pk'):
+        return '<%s %s>' % (meta.label_lower, value.pk)
+
+    return '<%s at %#x>' % (type(value).__name__, id(value))
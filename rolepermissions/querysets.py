@@ -0,0 +1,94 @@
+from __future__ import unicode_literals
+
+import inspect
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.db.models import Exists, OuterRef, Q
+
+from rolepermissions.roles import RolesManager, _get_user_throughs
+
+
+def superpowers_q():
+    """
+    Get a Q object matching the users that have every role and permission
+    because they are superusers. It matches nobody when
+    ``ROLEPERMISSIONS_SUPERUSER_SUPERPOWERS`` is disabled.
+    """
+    if not getattr(settings, 'ROLEPERMISSIONS_SUPERUSER_SUPERPOWERS', True):
+        return Q(pk__in=[])
+
+    return Q(is_superuser=True)
+
+
+def _get_role_names(roles):
+    registry = RolesManager.get_registry()
+    names = []
+    for role in roles:
+        name = role.get_name() if inspect.isclass(role) else role
+        if name in registry.roles:
+            names.append(name)
+
+    return names
+
+
+def _in_groups(group_names):
+    (group_through, group_user_field, group_field), _ = _get_user_throughs()
+    return Exists(group_through.objects.filter(**{
+        group_user_field: OuterRef('pk'),
+        '%s__in' % group_field: Group.objects.filter(name__in=group_names).values('pk'),
+    }))
+
+
+def users_with_any_role(roles, queryset=None):
+    """Get the users that have any of the given roles, in a single query."""
+    if queryset is None:
+        queryset = get_user_model().objects.all()
+
+    role_names = _get_role_names(roles)
+    if not role_names:
+        return queryset.filter(superpowers_q())
+
+    return queryset.filter(Q(_in_groups(role_names)) | superpowers_q())
+
+
+def users_with_role(role, queryset=None):
+    """Get the users that have the given role, in a single query."""
+    return users_with_any_role([role], queryset)
+
+
+def users_with_permission(permission_name, queryset=None):
+    """
+    Get the users that have the given permission, in a single query. Like
+    :py:func:`rolepermissions.checkers.has_permission`, the permission only
+    counts when one of the user's roles has it in its scope.
+    """
+    if queryset is None:
+        queryset = get_user_model().objects.all()
+
+    registry = RolesManager.get_registry()
+    role_names = [registry.names[role] for role in registry.roles_with_permission(permission_name)]
+    if not role_names:
+        return queryset.filter(superpowers_q())
+
+    _, (permission_through, permission_user_field, permission_field) = _get_user_throughs()
+    has_permission_row = Exists(permission_through.objects.filter(**{
+        permission_user_field: OuterRef('pk'),
+        '%s__in' % permission_field: Permission.objects.filter(codename=permission_name).values('pk'),
+    }))
+
+    return queryset.filter((Q(has_permission_row) & Q(_in_groups(role_names))) | superpowers_q())
+
+
+class RolePermissionsQuerySetMixin(object):
+    """Adds role and permission filters to the QuerySet of a custom user model."""
+
+    def with_role(self, role):
+        return users_with_role(role, self)
+
+    def with_any_role(self, roles):
+        return users_with_any_role(roles, self)
+
+    def with_permission(self, permission_name):
+        return users_with_permission(permission_name, self)
@@ -1,16 +1,96 @@
 from __future__ import unicode_literals
 
+import hashlib
 import inspect
+from types import MappingProxyType
+
+from asgiref.sync import sync_to_async
 
 from django.contrib.auth.models import Group, Permission
 from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.models import ContentType
 
-from rolepermissions.utils import camelToSnake, camel_or_snake_to_title
+from django.db.models.query import QuerySet
+
+from rolepermissions.utils import camelToSnake, camel_or_snake_to_title, get_through_field_names, alist
 from rolepermissions.exceptions import RoleDoesNotExist
+from rolepermissions.cache import (
+    bump_user_versions, drop_user_snapshot, invalidate_user_snapshot, group_cache, permission_cache)
+from rolepermissions.profiling import _tracked
 
 
+BULK_BATCH_SIZE = 1000
+
 registered_roles = {}
+_registry = None
+_permission_bits = {}  # permission name -> bit; positions are never reassigned within a process
+
+
+class RoleRegistry(object):
+    """
+    Immutable view of the registered roles, with everything the checkers
+    need precomputed:
+
+    - ``roles``: role name -> role class
+    - ``names``: role class -> role name
+    - ``permissions``: role class -> frozenset of permission names
+    - ``default_true_permissions``: role class -> frozenset of permission names granted by default
+    - ``permission_roles``: permission name -> frozenset of role classes having it in their scope
+    - ``permission_bits``: permission name -> single bit integer
+    - ``role_masks``: role class -> bitmask of the permissions in its scope
+    - ``fingerprint``: digest of the bit assignment, for keys of data stored outside the process
+    """
+
+    __slots__ = ('roles', 'names', 'permissions', 'default_true_permissions', 'permission_roles',
+                 'permission_bits', 'role_masks', 'fingerprint')
+
+    def __init__(self, roles):
+        names = {}
+        permissions = {}
+        default_true_permissions = {}
+        permission_roles = {}
+
+        for name, role in roles.items():
+            available_permissions = getattr(role, 'available_permissions', {})
+            names[role] = name
+            permissions[role] = frozenset(available_permissions)
+            default_true_permissions[role] = frozenset(
+                permission for permission, default in available_permissions.items() if default)
+            for permission in available_permissions:
+                permission_roles.setdefault(permission, set()).add(role)
+
+        self.roles = MappingProxyType(dict(roles))
+        self.names = MappingProxyType(names)
+        self.permissions = MappingProxyType(permissions)
+        self.default_true_permissions = MappingProxyType(default_true_permissions)
+        self.permission_roles = MappingProxyType(
+            dict((permission, frozenset(role_set)) for permission, role_set in permission_roles.items()))
+
+        for permission in sorted(permission_roles):
+            if permission not in _permission_bits:
+                _permission_bits[permission] = 1 << len(_permission_bits)
+        self.permission_bits = MappingProxyType(dict(_permission_bits))
+        self.role_masks = MappingProxyType(
+            dict((role, self.mask(role_permissions)) for role, role_permissions in permissions.items()))
+        # Cached snapshots hold masks scoped by role, so the key covers each role's scope and defaults too
+        lines = sorted(_permission_bits, key=_permission_bits.get)
+        for name, role in sorted(self.roles.items()):
+            lines.append('%s:%x:%x' % (name, self.role_masks[role], self.mask(default_true_permissions[role])))
+        self.fingerprint = hashlib.sha1('\n'.join(lines).encode('utf-8')).hexdigest()[:12]
+
+    def roles_with_permission(self, permission_name):
+        return self.permission_roles.get(permission_name, frozenset())
+
+    def mask(self, permission_names):
+        """Get the bitmask of the given permission names. Unknown names are ignored."""
+        bits = self.permission_bits
+        mask = 0
+        for permission_name in permission_names:
+            mask |= bits.get(permission_name, 0)
+        return mask
+
+    def permission_names_from_mask(self, mask):
+        return frozenset(name for name, bit in self.permission_bits.items() if mask & bit)
 
 
 class RolesManager(object):
@@ -18,6 +98,19 @@ class RolesManager(object):
     def __iter__(cls):
         return iter(registered_roles)
 
+    @classmethod
+    def get_registry(cls):
+        """
+        Get the compiled :py:class:`RoleRegistry`. It is rebuilt after
+        a new role is registered.
+        """
+        global _registry
+        registry = _registry
+        if registry is None:
+            registry = _registry = RoleRegistry(registered_roles)
+
+        return registry
+
     @classmethod
     def retrieve_role(cls, role_name):
         if role_name in registered_roles:
@@ -42,10 +135,12 @@ class RolesClassRegister(type):
             return False
 
     def __new__(cls, name, parents, dct):
+        global _registry
         meta = dct.get("Meta", None)
         role_class = super(RolesClassRegister, cls).__new__(cls, name, parents, dct)
         if not cls.is_abstract(meta):
             registered_roles[role_class.get_name()] = role_class
+            _registry = None
         return role_class
 
 
@@ -69,10 +164,11 @@ class AbstractUserRole(metaclass=RolesClassRegister):
         :returns: :py:class:`django.contrib.auth.models.Group` The group for the
             new role.
         """
-        group, _created = Group.objects.get_or_create(name=cls.get_name())
-        user.groups.add(group)
+        group, _created = cls.get_or_create_group()
+        user.groups.add(group.pk)
         permissions_to_add = cls.get_default_true_permissions()
         user.user_permissions.add(*permissions_to_add)
+        invalidate_user_snapshot(user)
 
         return group
 
@@ -135,7 +231,7 @@ class AbstractUserRole(metaclass=RolesClassRegister):
         current_adjusted_true_permissions = cls._get_adjusted_true_permissions(user)
 
         group, _created = cls.get_or_create_group()
-        user.groups.remove(group)
+        user.groups.remove(group.pk)
 
         # Grab the adjusted true permissions after the removal
         new_adjusted_true_permissions = cls._get_adjusted_true_permissions(user)
@@ -144,6 +240,7 @@ class AbstractUserRole(metaclass=RolesClassRegister):
         permissions_to_remove = (current_adjusted_true_permissions
                                  .difference(new_adjusted_true_permissions))
         user.user_permissions.remove(*permissions_to_remove)
+        invalidate_user_snapshot(user)
 
         return group
 
@@ -173,18 +270,7 @@ class AbstractUserRole(metaclass=RolesClassRegister):
 
     @classmethod
     def get_or_create_permissions(cls, permission_names):
-        user_ct = ContentType.objects.get_for_model(get_user_model())
-        permissions = list(Permission.objects.filter(
-            content_type=user_ct, codename__in=permission_names).all())
-
-        missing_permissions = set(permission_names) - set((p.codename for p in permissions))
-        if len(missing_permissions) > 0:
-            for permission_name in missing_permissions:
-                permission, created = get_or_create_permission(permission_name)
-                if created:  # assert created is True
-                    permissions.append(permission)
-
-        return permissions
+        return list(_get_permissions(permission_names).values())
 
     @classmethod
     def get_default(cls, permission_name):
@@ -192,7 +278,15 @@ class AbstractUserRole(metaclass=RolesClassRegister):
 
     @classmethod
     def get_or_create_group(cls):
-        return Group.objects.get_or_create(name=cls.get_name())
+        name = cls.get_name()
+        groups = _get_groups([name])
+        if name in groups:
+            return groups[name], False
+
+        group, created = Group.objects.get_or_create(name=name)
+        group_cache.add_many({name: group})
+
+        return group, created
 
 
 def get_or_create_permission(codename, name=camel_or_snake_to_title):
@@ -202,9 +296,76 @@ def get_or_create_permission(codename, name=camel_or_snake_to_title):
     @:param name: human-readable permissions name (str) or callable that takes codename as
                   argument and returns str
     """
+    cached, _missing = permission_cache.get_many([codename])
+    if cached:
+        return cached[codename], False
+
+    user_ct = ContentType.objects.get_for_model(get_user_model())
+    permission, created = Permission.objects.get_or_create(
+        content_type=user_ct, codename=codename, defaults={'name': name(codename) if callable(name) else name})
+    permission_cache.add_many({codename: permission})
+
+    return permission, created
+
+
+def _get_groups(group_names):
+    """
+    Get a dict of the existing groups with the given names.
+
+    Groups are kept in a process-wide cache, which is filled with the groups
+    of all the registered roles at once on first use.
+    """
+    groups, missing = group_cache.get_many(group_names)
+    if not missing:
+        return groups
+
+    names_to_fetch = set(missing)
+    load_all = not group_cache.loaded
+    if load_all:
+        names_to_fetch.update(RolesManager.get_registry().roles)
+
+    fetched = dict((group.name, group) for group in Group.objects.filter(name__in=names_to_fetch))
+    group_cache.add_many(fetched, loaded=load_all)
+    groups.update((name, fetched[name]) for name in missing if name in fetched)
+
+    return groups
+
+
+def _get_permissions(permission_names, create=True):
+    """
+    Get a dict of the Permission objects with the given codenames, for the
+    user content type. Missing ones are created in bulk, unless ``create``
+    is false.
+
+    Permissions are kept in a process-wide cache, which is filled with all
+    the registered permissions at once on first use.
+    """
+    permissions, missing = permission_cache.get_many(permission_names)
+    if not missing:
+        return permissions
+
     user_ct = ContentType.objects.get_for_model(get_user_model())
-    return Permission.objects.get_or_create(content_type=user_ct, codename=codename,
-                                            defaults={'name': name(codename) if callable(name) else name})
+    names_to_fetch = set(missing)
+    load_all = not permission_cache.loaded
+    if load_all:
+        names_to_fetch.update(RolesManager.get_registry().permission_roles)
+
+    fetched = dict((permission.codename, permission) for permission in Permission.objects.filter(
+        content_type=user_ct, codename__in=names_to_fetch))
+
+    names_to_create = [name for name in missing if name not in fetched]
+    if names_to_create and create:
+        Permission.objects.bulk_create(
+            [Permission(content_type=user_ct, codename=name, name=camel_or_snake_to_title(name))
+             for name in names_to_create],
+            ignore_conflicts=True)
+        fetched.update((permission.codename, permission) for permission in Permission.objects.filter(
+            content_type=user_ct, codename__in=names_to_create))
+
+    permission_cache.add_many(fetched, loaded=load_all)
+    permissions.update((name, fetched[name]) for name in missing if name in fetched)
+
+    return permissions
 
 
 def retrieve_role(role_name):
@@ -212,17 +373,32 @@ def retrieve_role(role_name):
     return RolesManager.retrieve_role(role_name)
 
 
+@_tracked
 def get_user_roles(user):
     """Get a list of a users's roles."""
     if user:
         groups = user.groups.all()   # Important! all() query may be cached on User with prefetch_related.
-        roles = (RolesManager.retrieve_role(group.name) for group in groups if group.name in RolesManager.get_roles_names())
-        return sorted(roles, key=lambda r: r.get_name() )
+        return _roles_from_groups(groups)
     else:
         return []
 
 
-def _assign_or_remove_role(user, role, method_name):
+@_tracked
+async def aget_user_roles(user):
+    """Async version of :py:func:`get_user_roles`."""
+    if user:
+        return _roles_from_groups(await alist(user.groups.all()))
+    else:
+        return []
+
+
+def _roles_from_groups(groups):
+    registry = RolesManager.get_registry()
+    roles = (registry.roles[group.name] for group in groups if group.name in registry.roles)
+    return sorted(roles, key=registry.names.__getitem__)
+
+
+def _get_role_class(role):
     role_cls = role
     if not inspect.isclass(role):
         role_cls = retrieve_role(role)
@@ -230,21 +406,30 @@ def _assign_or_remove_role(user, role, method_name):
     if not role_cls:
         raise RoleDoesNotExist
 
+    return role_cls
+
+
+def _assign_or_remove_role(user, role, method_name):
+    role_cls = _get_role_class(role)
+
     getattr(role_cls, method_name)(user)
 
     return role_cls
 
 
+@_tracked
 def assign_role(user, role):
     """Assign a role to a user."""
     return _assign_or_remove_role(user, role, "assign_role_to_user")
 
 
+@_tracked
 def remove_role(user, role):
     """Remove a role from a user."""
     return _assign_or_remove_role(user, role, "remove_role_from_user")
 
 
+@_tracked
 def clear_roles(user):
     """Remove all roles from a user."""
     roles = get_user_roles(user)
@@ -253,3 +438,203 @@ def clear_roles(user):
         role.remove_role_from_user(user)
 
     return roles
+
+
+@_tracked
+async def aassign_role(user, role):
+    """Async version of :py:func:`assign_role`."""
+    return await sync_to_async(assign_role)(user, role)
+
+
+@_tracked
+async def aremove_role(user, role):
+    """Async version of :py:func:`remove_role`."""
+    return await sync_to_async(remove_role)(user, role)
+
+
+@_tracked
+async def aclear_roles(user):
+    """Async version of :py:func:`clear_roles`."""
+    return await sync_to_async(clear_roles)(user)
+
+
+def _iter_user_pk_batches(users, batch_size):
+    """
+    Yield lists of user primary keys from a queryset, or an iterable of
+    users or primary keys. Snapshots attached to user instances are dropped.
+    """
+    if isinstance(users, QuerySet):
+        users = users.values_list('pk', flat=True).iterator(chunk_size=batch_size)
+
+    batch = []
+    for user in users:
+        if isinstance(user, get_user_model()):
+            drop_user_snapshot(user)
+            user = user.pk
+        batch.append(user)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+def _get_user_throughs():
+    """
+    Get the groups and user_permissions through models of the user model,
+    with the attnames of their foreign keys (user first).
+    """
+    user_model = get_user_model()
+    group_through = user_model.groups.through
+    permission_through = user_model.user_permissions.through
+    return (
+        (group_through,) + get_through_field_names(group_through, user_model),
+        (permission_through,) + get_through_field_names(permission_through, user_model),
+    )
+
+
+@_tracked
+def assign_role_bulk(users, role, batch_size=BULK_BATCH_SIZE):
+    """
+    Assign a role to many users at once.
+
+    ``users`` can be a queryset, or an iterable of users or user primary
+    keys. Rows are inserted straight into the groups and user_permissions
+    through tables, ``batch_size`` users at a time, so the number of queries
+    only depends on the number of batches. Like :py:func:`assign_role`,
+    users that already have the role get back any of its default permissions
+    they are missing, including revoked ones.
+
+    :returns: :py:class:`django.contrib.auth.models.Group` The group for the role.
+    """
+    role_cls = _get_role_class(role)
+    group, _created = role_cls.get_or_create_group()
+    permission_ids = [permission.pk for permission in role_cls.get_default_true_permissions()]
+    (group_through, group_user_field, group_field), \
+        (permission_through, permission_user_field, permission_field) = _get_user_throughs()
+
+    for user_pks in _iter_user_pk_batches(users, batch_size):
+        group_through.objects.bulk_create(
+            [group_through(**{group_user_field: pk, group_field: group.pk}) for pk in user_pks],
+            ignore_conflicts=True)
+        permission_through.objects.bulk_create(
+            [permission_through(**{permission_user_field: pk, permission_field: permission_id})
+             for pk in user_pks for permission_id in permission_ids],
+            ignore_conflicts=True)
+        bump_user_versions(user_pks)
+
+    return group
+
+
+def _get_role_group_ids(registry):
+    """Get the primary keys of the groups of the registered roles, by role."""
+    groups = _get_groups(registry.roles)
+    return dict((role, groups[name].pk) for name, role in registry.roles.items() if name in groups)
+
+
+def _get_permission_ids(permission_names):
+    permissions = _get_permissions(permission_names, create=False)
+    return dict((name, permission.pk) for name, permission in permissions.items())
+
+
+def _group_permissions_by_granting_groups(registry, role_group_ids, permission_names, exclude_role=None):
+    """
+    Group the primary keys of the given permissions by the set of group
+    primary keys whose roles grant them by default.
+    """
+    permission_ids = _get_permission_ids(permission_names)
+    permissions_by_groups = {}
+    for permission_name, permission_id in permission_ids.items():
+        group_ids = frozenset(
+            role_group_ids[role] for role in registry.roles_with_permission(permission_name)
+            if role is not exclude_role and role in role_group_ids
+            and permission_name in registry.default_true_permissions[role])
+        permissions_by_groups.setdefault(group_ids, []).append(permission_id)
+
+    return permissions_by_groups
+
+
+@_tracked
+def remove_role_bulk(users, role, batch_size=BULK_BATCH_SIZE):
+    """
+    Remove a role from many users at once.
+
+    ``users`` can be a queryset, or an iterable of users or user primary
+    keys. Like :py:func:`remove_role`, the permissions granted by default by
+    the role are revoked, unless another of the user's remaining roles also
+    grants them by default. The number of queries only depends on the number
+    of batches and on the role's permissions, not on the number of users.
+    """
+    role_cls = _get_role_class(role)
+    registry = RolesManager.get_registry()
+    role_group_ids = _get_role_group_ids(registry)
+    group_id = role_group_ids.get(role_cls)
+    if group_id is None:  # nobody has this role
+        return role_cls
+
+    permissions_by_groups = _group_permissions_by_granting_groups(
+        registry, role_group_ids, registry.default_true_permissions[role_cls], exclude_role=role_cls)
+    (group_through, group_user_field, group_field), \
+        (permission_through, permission_user_field, permission_field) = _get_user_throughs()
+
+    for user_pks in _iter_user_pk_batches(users, batch_size):
+        members = list(group_through.objects
+                       .filter(**{group_field: group_id, '%s__in' % group_user_field: user_pks})
+                       .values_list(group_user_field, flat=True))
+        if not members:
+            continue
+
+        for group_ids, permission_ids in permissions_by_groups.items():
+            revoked = permission_through.objects.filter(**{
+                '%s__in' % permission_user_field: members,
+                '%s__in' % permission_field: permission_ids,
+            })
+            if group_ids:  # keep permissions still granted by another role of the user
+                revoked = revoked.exclude(**{'%s__in' % permission_user_field: group_through.objects.filter(
+                    **{'%s__in' % group_field: group_ids}).values(group_user_field)})
+            revoked.delete()
+
+        group_through.objects.filter(**{group_field: group_id, '%s__in' % group_user_field: members}).delete()
+        bump_user_versions(members)
+
+    return role_cls
+
+
+@_tracked
+def clear_roles_bulk(users, batch_size=BULK_BATCH_SIZE):
+    """
+    Remove all roles from many users at once.
+
+    ``users`` can be a queryset, or an iterable of users or user primary
+    keys. Like :py:func:`clear_roles`, every permission granted by default
+    by one of the user's roles is revoked.
+    """
+    registry = RolesManager.get_registry()
+    role_group_ids = _get_role_group_ids(registry)
+    if not role_group_ids:
+        return
+
+    default_true_permissions = set()
+    for role in role_group_ids:
+        default_true_permissions.update(registry.default_true_permissions[role])
+    permissions_by_groups = _group_permissions_by_granting_groups(
+        registry, role_group_ids, default_true_permissions)
+    (group_through, group_user_field, group_field), \
+        (permission_through, permission_user_field, permission_field) = _get_user_throughs()
+
+    for user_pks in _iter_user_pk_batches(users, batch_size):
+        for group_ids, permission_ids in permissions_by_groups.items():
+            permission_through.objects.filter(**{
+                '%s__in' % permission_user_field: group_through.objects.filter(**{
+                    '%s__in' % group_user_field: user_pks,
+                    '%s__in' % group_field: group_ids,
+                }).values(group_user_field),
+                '%s__in' % permission_field: permission_ids,
+            }).delete()
+
+        group_through.objects.filter(**{
+            '%s__in' % group_user_field: user_pks,
+            '%s__in' % group_field: list(role_group_ids.values()),
+        }).delete()
+        bump_user_versions(user_pks)
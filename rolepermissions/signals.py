@@ -0,0 +1,84 @@
+from __future__ import unicode_literals
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save, pre_delete
+
+from rolepermissions.cache import (
+    bump_user_versions, get_cache, invalidate_user_snapshot, group_cache, permission_cache)
+from rolepermissions.utils import get_through_field_names
+
+
+def _related_user_pks(through, related_pk):
+    user_field, related_field = get_through_field_names(through, get_user_model())
+    return list(through.objects.filter(**{related_field: related_pk})
+                .values_list(user_field, flat=True))
+
+
+def user_relations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Invalidate snapshots when a user's groups or permissions change."""
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate_user_snapshot(instance)
+        return
+
+    if get_cache() is None:
+        return
+
+    if action in ('post_add', 'post_remove'):
+        bump_user_versions(list(pk_set or ()), using=kwargs.get('using'))
+    elif action == 'pre_clear':
+        bump_user_versions(_related_user_pks(sender, instance.pk), using=kwargs.get('using'))
+
+
+def user_created(sender, instance, created, **kwargs):
+    """Discard anything cached under the primary key of a new user."""
+    if created:
+        bump_user_versions([instance.pk], using=kwargs.get('using'))
+
+
+def related_object_deleted(sender, instance, **kwargs):
+    """Invalidate snapshots of users whose group or permission is being deleted."""
+    through = _THROUGH_BY_MODEL.get(sender)
+    if through is not None and get_cache() is not None:
+        bump_user_versions(_related_user_pks(through, instance.pk), using=kwargs.get('using'))
+
+
+def permission_changed(sender, **kwargs):
+    permission_cache.clear()
+
+
+def group_changed(sender, **kwargs):
+    group_cache.clear()
+
+
+def database_flushed(sender, **kwargs):
+    """``flush`` and ``migrate`` can drop rows without sending deletion signals."""
+    permission_cache.clear()
+    group_cache.clear()
+
+
+_THROUGH_BY_MODEL = {}
+
+
+def connect_signals():
+    post_save.connect(permission_changed, sender=Permission, dispatch_uid='rolepermissions_permission_saved')
+    post_delete.connect(permission_changed, sender=Permission, dispatch_uid='rolepermissions_permission_deleted')
+    post_save.connect(group_changed, sender=Group, dispatch_uid='rolepermissions_group_saved')
+    post_delete.connect(group_changed, sender=Group, dispatch_uid='rolepermissions_group_deleted')
+    post_migrate.connect(database_flushed, dispatch_uid='rolepermissions_post_migrate')
+
+    user_model = get_user_model()
+    if not hasattr(user_model, 'groups') or not hasattr(user_model, 'user_permissions'):
+        return
+
+    _THROUGH_BY_MODEL[Group] = user_model.groups.through
+    _THROUGH_BY_MODEL[Permission] = user_model.user_permissions.through
+
+    for through in _THROUGH_BY_MODEL.values():
+        m2m_changed.connect(user_relations_changed, sender=through,
+                            dispatch_uid='rolepermissions_%s' % through._meta.label_lower)
+    for model in _THROUGH_BY_MODEL:
+        pre_delete.connect(related_object_deleted, sender=model,
+                           dispatch_uid='rolepermissions_%s_deleted' % model._meta.label_lower)
+    post_save.connect(user_created, sender=user_model, dispatch_uid='rolepermissions_user_created')
@@ -1,21 +1,65 @@
 from __future__ import unicode_literals
 
+from functools import lru_cache
+
 from django import template
 
-from rolepermissions.checkers import has_role, has_permission, has_object_permission
+from rolepermissions.roles import RolesManager
+from rolepermissions.checkers import (
+    has_role, has_permission, has_object_permission, object_permission_map, ObjectPermissionMap, _check_superpowers)
+from rolepermissions.cache import get_user_snapshot
 
 
 register = template.Library()
 
 
+class UserPermissions(object):
+    """
+    Roles and permissions of a user, computed once and then checked in
+    constant time by the ``has_role`` and ``can`` filters.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.is_superuser = bool(_check_superpowers(user))
+        snapshot = get_user_snapshot(user)
+        self.role_names = frozenset(role.get_name() for role in snapshot.roles)
+        self.permission_mask = snapshot.permission_mask
+
+    def has_role(self, role_names):
+        return self.is_superuser or not self.role_names.isdisjoint(role_names)
+
+    def can(self, permission_name):
+        if self.is_superuser:
+            return True
+
+        bit = RolesManager.get_registry().permission_bits.get(permission_name)
+        return bool(bit and self.permission_mask & bit)
+
+
+@lru_cache(maxsize=1024)
+def _parse_role_list(role):
+    # Filter arguments are the same strings on every render, only split them once.
+    return tuple(role.split(','))
+
+
 @register.filter(name='has_role')
 def has_role_template_tag(user, role):
-    role_list = role.split(',')
-    return has_role(user, role_list)
+    role_list = _parse_role_list(role)
+    if isinstance(user, UserPermissions):
+        return user.has_role(role_list)
+
+    return has_role(user, list(role_list))
 
 
 @register.filter(name='can')
 def can_template_tag(user, role):
+    if isinstance(user, UserPermissions):
+        return user.can(role)
+
+    if isinstance(user, ObjectPermissionMap):
+        return user.get(role, False)
+
     return has_permission(user, role)
 
 
@@ -34,3 +78,22 @@ def has_permission_template_tag(context, permission, obj, user=None):
         return has_object_permission(permission, user, obj)
 
     return False
+
+
+@tag_registter(name='load_user_permissions', takes_context=True)
+def load_user_permissions_template_tag(context, user=None):
+    if not user:
+        user = context.get('user')
+
+    return UserPermissions(user)
+
+
+@tag_registter(name='prefetch_object_permissions', takes_context=True)
+def prefetch_object_permissions_template_tag(context, checker_name, objects, user=None):
+    if not user:
+        user = context.get('user')
+
+    if not user:
+        return ObjectPermissionMap(checker_name)
+
+    return object_permission_map(checker_name, user, objects or [])
@@ -1,6 +1,9 @@
 from __future__ import unicode_literals
 
 import re
+
+import django
+from asgiref.sync import sync_to_async
 try:
     from collections.abc import Callable
 except ImportError:
@@ -16,15 +19,16 @@ def user_is_authenticated(user):
     return authenticated
 
 
+_underscorer1 = re.compile(r'(.)([A-Z][a-z]+)')
+_underscorer2 = re.compile('([a-z0-9])([A-Z])')
+
+
 def camelToSnake(s):
     """
     https://gist.github.com/jaytaylor/3660565
     Is it ironic that this function is written in camel case, yet it
     converts to snake case? hmm..
     """
-    _underscorer1 = re.compile(r'(.)([A-Z][a-z]+)')
-    _underscorer2 = re.compile('([a-z0-9])([A-Z])')
-
     subbed = _underscorer1.sub(r'\1_\2', s)
     return _underscorer2.sub(r'\1_\2', subbed).lower()
 
@@ -35,3 +39,30 @@ def snake_to_title(s):
 
 def camel_or_snake_to_title(s):
     return snake_to_title(camelToSnake(s))
+
+
+def get_through_field_names(through, model):
+    """
+    Get the attnames of the two foreign keys of a many-to-many through
+    model: the one pointing to ``model`` and the other one.
+    """
+    model_field = related_field = None
+    for field in through._meta.concrete_fields:
+        if not field.is_relation:
+            continue
+        if field.related_model is model:
+            model_field = field.attname
+        else:
+            related_field = field.attname
+
+    return model_field, related_field
+
+
+if django.VERSION >= (4, 1):
+    async def alist(queryset):
+        """Evaluate a queryset with the async ORM."""
+        return [obj async for obj in queryset]
+else:
+    async def alist(queryset):
+        """Evaluate a queryset in a thread; this Django version has no async iteration."""
+        return await sync_to_async(list)(queryset)
@@ -1,16 +1,22 @@
+import json
 from collections import namedtuple
 from io import StringIO
 
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.test import TestCase
+from django.test.signals import setting_changed
 
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group, Permission
 
 from model_mommy import mommy
 
-from rolepermissions.roles import AbstractUserRole, get_user_roles
+from rolepermissions.roles import AbstractUserRole, get_user_roles, assign_role
+from rolepermissions.permissions import grant_permission, revoke_permission, register_object_checker
 from rolepermissions.admin import RolePermissionsUserAdminMixin
+from rolepermissions.management.commands.sync_roles import split_pk_range, reset_user_permissions_range
+from rolepermissions.management.commands.rolepermissions_loadtest import parse_mix
 
 
 class AdminRole1(AbstractUserRole):
@@ -20,6 +26,11 @@ class AdminRole1(AbstractUserRole):
     }
 
 
+@register_object_checker()
+def admin_loadtest_checker(role, user, obj):
+    return user.pk == obj.pk
+
+
 class UserAdminMixinTest(TestCase):
 
     class UserAdminMock:
@@ -98,3 +109,121 @@ class SyncRolesTest(TestCase):
         group_names = [group['name'] for group in Group.objects.all().values('name')]
         self.assertIn(grp1.name, group_names)
         self.assertIn(grp2.name, group_names)
+
+    def test_sync_user_role_permissions_in_batches(self):
+        users = mommy.make(get_user_model(), _quantity=5)
+        grp = mommy.make(Group, name=AdminRole1.get_name())
+        for user in users:
+            user.groups.add(grp)
+        out = StringIO()
+        call_command('sync_roles', reset_user_permissions=True, batch_size=2, stdout=out)
+
+        for user in users:
+            user_permission_names = [perm['codename'] for perm in user.user_permissions.all().values('codename')]
+            self.assertIn('admin_perm1', user_permission_names)
+            self.assertNotIn('admin_perm2', user_permission_names)
+        self.assertIn('Reset 4 Users, last pk: %s' % users[3].pk, out.getvalue())
+        self.assertIn('Reset 5 Users in', out.getvalue())
+
+    def test_sync_user_role_permissions_from_start_pk(self):
+        users = mommy.make(get_user_model(), _quantity=3)
+        grp = mommy.make(Group, name=AdminRole1.get_name())
+        for user in users:
+            user.groups.add(grp)
+        out = StringIO()
+        call_command('sync_roles', reset_user_permissions=True, start_pk=str(users[0].pk), stdout=out)
+
+        self.assertFalse(users[0].user_permissions.exists())
+        self.assertTrue(users[1].user_permissions.filter(codename='admin_perm1').exists())
+        self.assertTrue(users[2].user_permissions.filter(codename='admin_perm1').exists())
+
+    def test_sync_user_role_permissions_keeps_granted_permissions(self):
+        user = mommy.make(get_user_model())
+        assign_role(user, AdminRole1)
+        revoke_permission(user, 'admin_perm1')
+        grant_permission(user, 'admin_perm2')
+        out = StringIO()
+        call_command('sync_roles', reset_user_permissions=True, stdout=out)
+
+        user_permission_names = set(user.user_permissions.values_list('codename', flat=True))
+        self.assertSetEqual({'admin_perm1', 'admin_perm2'}, user_permission_names)
+
+    def test_split_pk_range(self):
+        self.assertListEqual([(0, 4), (4, 8), (8, 10)], split_pk_range(1, 10, 3))
+        self.assertListEqual([(4, 5)], split_pk_range(5, 5, 3))
+        self.assertListEqual([(9, 10), (10, 11)], split_pk_range(10, 11, 4))
+
+    def test_reset_user_permissions_range(self):
+        users = mommy.make(get_user_model(), _quantity=4)
+        grp = mommy.make(Group, name=AdminRole1.get_name())
+        for user in users:
+            user.groups.add(grp)
+        AdminRole1.get_default_true_permissions()
+
+        count = reset_user_permissions_range(10, users[0].pk, users[2].pk)
+
+        self.assertEqual(2, count)
+        self.assertListEqual([False, True, True, False],
+                             [user.user_permissions.exists() for user in users])
+
+
+class LoadtestCommandTests(TestCase):
+
+    def run_loadtest(self, **options):
+        out = StringIO()
+        options.setdefault('threads', 1)
+        options.setdefault('operations', 50)
+        call_command('rolepermissions_loadtest', json=True, stdout=out, **options)
+        return json.loads(out.getvalue())
+
+    def test_sampled_users(self):
+        users = mommy.make(get_user_model(), _quantity=3)
+        assign_role(users[0], AdminRole1)
+
+        results = self.run_loadtest(users=2, checker='admin_loadtest_checker')
+
+        self.assertListEqual(['lazy', 'request', 'uncached'], sorted(results))
+        for result in results.values():
+            self.assertEqual(50, result['operations'])
+            self.assertGreater(result['ops_per_second'], 0)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        self.assertLess(results['request']['queries_per_op'], results['uncached']['queries_per_op'])
+        self.assertEqual(3, get_user_model().objects.count())
+
+    def test_synthetic_users_with_mutations(self):
+        changed_settings = []
+
+        def receiver(setting, **kwargs):
+            changed_settings.append(setting)
+
+        setting_changed.connect(receiver)
+        try:
+            results = self.run_loadtest(synthetic=5, mix='has_role=1,mutation=1', cache='default')
+        finally:
+            setting_changed.disconnect(receiver)
+
+        self.assertIn('shared_cache', results)
+        self.assertListEqual([], changed_settings)
+        self.assertEqual(0, get_user_model().objects.count())
+
+    def test_mutations_need_synthetic_users(self):
+        mommy.make(get_user_model())
+
+        with self.assertRaises(CommandError):
+            self.run_loadtest(mix='mutation=1')
+
+    def test_table_output(self):
+        mommy.make(get_user_model())
+        out = StringIO()
+
+        call_command('rolepermissions_loadtest', threads=1, operations=10, stdout=out)
+
+        self.assertIn('queries/op', out.getvalue())
+        self.assertIn('uncached', out.getvalue())
+
+    def test_parse_mix(self):
+        self.assertListEqual([('has_role', 3), ('mutation', 1)], parse_mix('has_role=3,has_permission=0,mutation=1'))
+        with self.assertRaises(CommandError):
+            parse_mix('has_group=1')
+        with self.assertRaises(CommandError):
+            parse_mix('has_role=many')
@@ -0,0 +1,436 @@
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.core.cache import cache, caches
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.db import transaction
+
+from model_mommy import mommy
+
+from rolepermissions.roles import AbstractUserRole, assign_role, remove_role
+from rolepermissions.permissions import grant_permission, revoke_permission, register_object_checker
+from rolepermissions.checkers import has_role, has_permission, has_object_permission, ahas_permission
+from rolepermissions.cache import (
+    get_user_snapshot, invalidate_user_snapshot, get_cache_stats, reset_cache_stats, group_cache, permission_cache,
+    prefetch_role_data, get_memo_stats, reset_memo_stats, build_user_snapshot, _get_cached_snapshot, _get_version,
+    _snapshot_key, _snapshot_to_data, get_cache, using_cache)
+
+
+class CacRole1(AbstractUserRole):
+    available_permissions = {
+        'cac_permission1': True,
+        'cac_permission2': False,
+    }
+
+
+class CacRole2(AbstractUserRole):
+    available_permissions = {
+        'cac_permission3': True,
+    }
+
+
+@register_object_checker()
+def cac_checker(role, user, obj):
+    return role is CacRole2
+
+
+class UserSnapshotTests(TestCase):
+
+    def setUp(self):
+        self.user = mommy.make(get_user_model())
+        assign_role(self.user, CacRole1)
+
+    def test_snapshot_contents(self):
+        snapshot = get_user_snapshot(self.user)
+
+        self.assertListEqual([CacRole1], list(snapshot.roles))
+        self.assertEqual(frozenset(['cac_permission1']), snapshot.permission_names)
+
+    def test_none_user(self):
+        snapshot = get_user_snapshot(None)
+
+        self.assertListEqual([], list(snapshot.roles))
+        self.assertEqual(frozenset(), snapshot.permission_names)
+
+    def test_repeated_checks_reuse_snapshot(self):
+        user = get_user_model().objects.get(pk=self.user.pk)
+
+        with self.assertNumQueries(2):
+            for i in range(5):
+                has_role(user, CacRole1)
+                has_permission(user, 'cac_permission1')
+
+    def test_invalidate_user_snapshot(self):
+        user = self.user
+        get_user_snapshot(user)
+
+        invalidate_user_snapshot(user)
+
+        with self.assertNumQueries(1):
+            get_user_snapshot(user)
+
+    def test_permissions_are_loaded_on_first_use(self):
+        user = get_user_model().objects.get(pk=self.user.pk)
+
+        with self.assertNumQueries(1):
+            self.assertTrue(has_role(user, CacRole1))
+        with self.assertNumQueries(1):
+            self.assertTrue(has_permission(user, 'cac_permission1'))
+            self.assertTrue(has_permission(user, 'cac_permission1'))
+
+    def test_async_checks_load_permissions_in_a_thread(self):
+        user = get_user_model().objects.get(pk=self.user.pk)
+        has_role(user, CacRole1)
+
+        self.assertTrue(async_to_sync(ahas_permission)(user, 'cac_permission1'))
+
+    def test_assign_role_invalidates_snapshot(self):
+        user = self.user
+        self.assertFalse(has_role(user, CacRole2))
+
+        assign_role(user, CacRole2)
+
+        self.assertTrue(has_role(user, CacRole2))
+        self.assertTrue(has_permission(user, 'cac_permission3'))
+
+    def test_remove_role_invalidates_snapshot(self):
+        user = self.user
+        self.assertTrue(has_role(user, CacRole1))
+
+        remove_role(user, CacRole1)
+
+        self.assertFalse(has_role(user, CacRole1))
+        self.assertFalse(has_permission(user, 'cac_permission1'))
+
+    def test_grant_and_revoke_permission_invalidate_snapshot(self):
+        user = self.user
+        self.assertFalse(has_permission(user, 'cac_permission2'))
+
+        grant_permission(user, 'cac_permission2')
+        self.assertTrue(has_permission(user, 'cac_permission2'))
+
+        revoke_permission(user, 'cac_permission2')
+        self.assertFalse(has_permission(user, 'cac_permission2'))
+
+
+@override_settings(ROLEPERMISSIONS_CACHE='default')
+class SnapshotCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        reset_cache_stats()
+        self.user = mommy.make(get_user_model())
+        assign_role(self.user, CacRole1)
+
+    def fetch_user(self):
+        return get_user_model().objects.get(pk=self.user.pk)
+
+    def warm_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            get_user_snapshot(self.fetch_user())
+
+    def test_cache_hit_needs_no_queries(self):
+        self.warm_cache()
+        user = self.fetch_user()
+
+        with self.assertNumQueries(0):
+            self.assertTrue(has_role(user, CacRole1))
+            self.assertTrue(has_permission(user, 'cac_permission1'))
+            self.assertFalse(has_permission(user, 'cac_permission2'))
+
+        self.assertEqual({'hits': 1, 'misses': 1}, get_cache_stats())
+
+    def test_snapshot_is_not_shared_before_commit(self):
+        get_user_snapshot(self.fetch_user())
+        get_user_snapshot(self.fetch_user())
+
+        self.assertEqual({'hits': 0, 'misses': 2}, get_cache_stats())
+
+    def test_assign_role_bumps_version(self):
+        self.warm_cache()
+
+        assign_role(self.fetch_user(), CacRole2)
+
+        self.assertTrue(has_role(self.fetch_user(), CacRole2))
+        self.assertEqual(2, get_cache_stats()['misses'])
+
+    def test_orm_changes_bump_version(self):
+        self.warm_cache()
+
+        group = Group.objects.get(name=CacRole1.get_name())
+        self.fetch_user().groups.remove(group)
+
+        self.assertFalse(has_role(self.fetch_user(), CacRole1))
+
+    def test_reverse_orm_changes_bump_version(self):
+        self.warm_cache()
+
+        group = Group.objects.get(name=CacRole1.get_name())
+        group.user_set.clear()
+
+        self.assertFalse(has_role(self.fetch_user(), CacRole1))
+
+    def test_group_deletion_bumps_version(self):
+        self.warm_cache()
+
+        Group.objects.filter(name=CacRole1.get_name()).delete()
+
+        self.assertFalse(has_role(self.fetch_user(), CacRole1))
+
+
+class UsingCacheTests(TestCase):
+
+    def test_overrides_the_setting(self):
+        self.assertIsNone(get_cache())
+        with using_cache('default'):
+            self.assertIs(caches['default'], get_cache())
+        self.assertIsNone(get_cache())
+
+    @override_settings(ROLEPERMISSIONS_CACHE='default')
+    def test_disables_the_cache(self):
+        with using_cache(None):
+            self.assertIsNone(get_cache())
+        self.assertIs(caches['default'], get_cache())
+
+
+class SnapshotCacheLockTests(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = mommy.make(get_user_model())
+        assign_role(self.user, CacRole1)
+        self.key = _snapshot_key(self.user.pk, _get_version(cache, self.user.pk))
+        self.lock_key = '%s:lock' % self.key
+        self.locked_while_building = []
+
+    def build(self, user):
+        self.locked_while_building.append(cache.get(self.lock_key) is not None)
+        return build_user_snapshot(user)
+
+    def test_lock_is_held_while_building(self):
+        snapshot = _get_cached_snapshot(cache, self.user, self.build)
+
+        self.assertListEqual([True], self.locked_while_building)
+        self.assertIsNone(cache.get(self.lock_key))
+        self.assertEqual(_snapshot_to_data(snapshot), cache.get(self.key))
+
+    def test_lock_is_released_when_building_fails(self):
+        def build(user):
+            raise ValueError()
+
+        with self.assertRaises(ValueError):
+            _get_cached_snapshot(cache, self.user, build)
+
+        self.assertIsNone(cache.get(self.lock_key))
+
+    def test_no_lock_inside_a_transaction(self):
+        with transaction.atomic():
+            _get_cached_snapshot(cache, self.user, self.build)
+            self.assertIsNone(cache.get(self.key))
+
+        self.assertListEqual([False], self.locked_while_building)
+        self.assertIsNotNone(cache.get(self.key))
+
+    def test_waits_for_the_lock_holder(self):
+        cache.add(self.lock_key, 1)
+        data = _snapshot_to_data(build_user_snapshot(self.user))
+
+        with patch('rolepermissions.cache.time.sleep', side_effect=lambda seconds: cache.set(self.key, data)):
+            snapshot = _get_cached_snapshot(cache, self.user, self.build)
+
+        self.assertListEqual([], self.locked_while_building)
+        self.assertEqual(data, _snapshot_to_data(snapshot))
+
+    def test_builds_after_waiting_too_long(self):
+        cache.add(self.lock_key, 1)
+
+        with patch('rolepermissions.cache.time.sleep') as sleep:
+            _get_cached_snapshot(cache, self.user, self.build)
+
+        self.assertEqual(20, sleep.call_count)
+        self.assertListEqual([True], self.locked_while_building)
+
+
+class PermissionCacheTests(TestCase):
+
+    def setUp(self):
+        permission_cache.clear()
+
+    def tearDown(self):
+        permission_cache.clear()
+
+    def test_registered_permissions_are_loaded_at_once(self):
+        CacRole1.get_all_permissions()
+        CacRole2.get_all_permissions()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CacRole1.get_default_true_permissions()
+
+        self.assertTrue(permission_cache.loaded)
+        with self.assertNumQueries(0):
+            permissions = CacRole1.get_all_permissions() + CacRole2.get_default_true_permissions()
+
+        self.assertSetEqual({'cac_permission1', 'cac_permission2', 'cac_permission3'},
+                            set(permission.codename for permission in permissions))
+
+    def test_missing_permissions_are_created_in_bulk(self):
+        with self.assertNumQueries(3):  # load, create, fetch the created ones
+            permissions = CacRole1.get_all_permissions()
+
+        self.assertEqual(2, len(permissions))
+        self.assertEqual(2, Permission.objects.filter(codename__startswith='cac_permission').count())
+
+    def test_not_shared_before_commit(self):
+        CacRole1.get_default_true_permissions()
+
+        self.assertFalse(permission_cache.loaded)
+        self.assertEqual(({}, ['cac_permission1']), permission_cache.get_many(['cac_permission1']))
+
+    def test_permission_changes_clear_the_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            permission = CacRole1.get_default_true_permissions()[0]
+
+        permission.delete()
+
+        self.assertFalse(permission_cache.loaded)
+        self.assertEqual(1, len(CacRole1.get_default_true_permissions()))
+
+
+class GroupCacheTests(TestCase):
+
+    def setUp(self):
+        group_cache.clear()
+        CacRole1.get_or_create_group()
+        CacRole2.get_or_create_group()
+        group_cache.clear()
+
+    def tearDown(self):
+        group_cache.clear()
+        permission_cache.clear()
+
+    def test_role_groups_are_loaded_at_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(1):
+                group, created = CacRole1.get_or_create_group()
+
+        self.assertFalse(created)
+        self.assertEqual(CacRole1.get_name(), group.name)
+        with self.assertNumQueries(0):
+            group, created = CacRole2.get_or_create_group()
+        self.assertEqual(CacRole2.get_name(), group.name)
+
+    def test_assign_role_uses_cached_group(self):
+        user = mommy.make(get_user_model())
+        with self.captureOnCommitCallbacks(execute=True):
+            CacRole1.get_or_create_group()
+            CacRole1.get_default_true_permissions()
+
+        with self.assertNumQueries(4):  # select and insert for groups and for permissions
+            group = CacRole1.assign_role_to_user(user)
+
+        self.assertIn(group, user.groups.all())
+
+    def test_group_changes_clear_the_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            group, _created = CacRole1.get_or_create_group()
+
+        group.delete()
+
+        self.assertFalse(group_cache.loaded)
+        group, created = CacRole1.get_or_create_group()
+        self.assertTrue(created)
+
+
+class PrefetchRoleDataTests(TestCase):
+
+    def setUp(self):
+        self.users = mommy.make(get_user_model(), _quantity=4)
+        assign_role(self.users[0], CacRole1)
+        assign_role(self.users[1], CacRole1)
+        grant_permission(self.users[1], 'cac_permission2')
+        assign_role(self.users[2], CacRole1)
+        assign_role(self.users[2], CacRole2)
+        revoke_permission(self.users[2], 'cac_permission1')
+        self.users[3].user_permissions.add(*CacRole2.get_default_true_permissions())  # out of roles scope
+
+    def test_snapshots_match_checkers(self):
+        users = prefetch_role_data(get_user_model().objects.filter(pk__in=[user.pk for user in self.users]))
+
+        for user, expected_user in zip(sorted(users, key=lambda u: u.pk), self.users):
+            expected = get_user_snapshot(get_user_model().objects.get(pk=expected_user.pk))
+            snapshot = get_user_snapshot(user)
+            self.assertListEqual(list(expected.roles), list(snapshot.roles))
+            self.assertEqual(expected.permission_mask, snapshot.permission_mask)
+
+    def test_one_query_for_all_users(self):
+        queryset = get_user_model().objects.filter(pk__in=[user.pk for user in self.users])
+
+        with self.assertNumQueries(2):  # users, then their groups and permissions together
+            users = prefetch_role_data(queryset)
+
+        with self.assertNumQueries(0):
+            for user in users:
+                has_role(user, CacRole1)
+                has_permission(user, 'cac_permission1')
+                has_object_permission('cac_checker', user, None)
+
+    def test_empty_list(self):
+        with self.assertNumQueries(0):
+            self.assertListEqual([], prefetch_role_data([]))
+
+
+class MemoizedCheckerTests(TestCase):
+
+    def setUp(self):
+        reset_memo_stats()
+        self.user = mommy.make(get_user_model())
+        self.objects = mommy.make(get_user_model(), _quantity=2)
+        assign_role(self.user, CacRole1)
+        self.calls = []
+
+        @register_object_checker(memoize=True)
+        def cac_memoized_checker(role, user, obj):
+            self.calls.append(obj)
+            return obj == self.objects[0]
+
+        @register_object_checker()
+        def cac_plain_checker(role, user, obj):
+            self.calls.append(obj)
+            return True
+
+    def test_repeated_checks_run_the_checker_once(self):
+        for i in range(3):
+            self.assertTrue(has_object_permission('cac_memoized_checker', self.user, self.objects[0]))
+            self.assertFalse(has_object_permission('cac_memoized_checker', self.user, self.objects[1]))
+
+        self.assertListEqual(self.objects, self.calls)
+        self.assertEqual({'hits': 4, 'misses': 2}, get_memo_stats())
+
+    def test_memo_is_per_user_instance(self):
+        has_object_permission('cac_memoized_checker', self.user, self.objects[0])
+        has_object_permission('cac_memoized_checker', get_user_model().objects.get(pk=self.user.pk), self.objects[0])
+
+        self.assertEqual(2, len(self.calls))
+
+    def test_role_changes_drop_the_memo(self):
+        has_object_permission('cac_memoized_checker', self.user, self.objects[0])
+        assign_role(self.user, CacRole2)
+        has_object_permission('cac_memoized_checker', self.user, self.objects[0])
+
+        self.assertEqual(2, len(self.calls))
+
+    def test_checkers_are_not_memoized_by_default(self):
+        has_object_permission('cac_plain_checker', self.user, self.objects[0])
+        has_object_permission('cac_plain_checker', self.user, self.objects[0])
+
+        self.assertEqual(2, len(self.calls))
+        self.assertEqual({'hits': 0, 'misses': 0}, get_memo_stats())
+
+    def test_objects_without_pk_are_not_memoized(self):
+        obj = get_user_model()()
+        has_object_permission('cac_memoized_checker', self.user, obj)
+        has_object_permission('cac_memoized_checker', self.user, obj)
+
+        self.assertEqual(2, len(self.calls))
@@ -1,4 +1,6 @@
 
+import asyncio
+
 from django.views.generic import DetailView
 from django.utils.decorators import method_decorator
 from django.test import TestCase
@@ -10,7 +12,8 @@ from django.http.response import HttpResponse
 
 from model_mommy import mommy
 
-from rolepermissions.roles import AbstractUserRole
+from rolepermissions.roles import RolesManager, AbstractUserRole, aassign_role
+from rolepermissions.exceptions import RoleDoesNotExist
 from rolepermissions.decorators import has_role_decorator, has_permission_decorator
 
 
@@ -129,7 +132,7 @@ class PermissionOverhiddenRedirectView(DetailView):
 
 class RoleOverhiddenRedirectView(DetailView):
 
-    @method_decorator(has_role_decorator('permission2', redirect_to_login=False))
+    @method_decorator(has_role_decorator('dec_role2', redirect_to_login=False))
     def dispatch(self, request, *args, **kwargs):
         return super(RoleOverhiddenRedirectView, self).dispatch(request, *args, **kwargs)
 
@@ -155,7 +158,7 @@ class PermissionOverhiddenRedirectViewRedirectUrl(DetailView):
 
 class RoleOverhiddenRedirectViewRedirectUrl(DetailView):
 
-    @method_decorator(has_role_decorator('permission2', redirect_url='/new_redirect'))
+    @method_decorator(has_role_decorator('dec_role2', redirect_url='/new_redirect'))
     def dispatch(self, request, *args, **kwargs):
         return super(RoleOverhiddenRedirectViewRedirectUrl, self).dispatch(request, *args, **kwargs)
 
@@ -279,3 +282,99 @@ class NotRedirectToLoginTests(TestCase):
 
         with self.assertRaises(PermissionDenied):
             HasRoleDetailView.as_view()(request)
+
+
+@has_role_decorator('dec_role1')
+async def async_role_view(request):
+    return HttpResponse("Test")
+
+
+@has_permission_decorator('permission3', redirect_url='/denied/')
+async def async_permission_view(request):
+    return HttpResponse("Test")
+
+
+@override_settings(ROOT_URLCONF='tests.mock_urls')
+class AsyncDecoratorTests(TestCase):
+
+    def setUp(self):
+        self.user = mommy.make(get_user_model())
+
+        self.request = RequestFactory().get('/')
+        self.request.session = {}
+        self.request.user = self.user
+
+    def test_decorated_view_stays_a_coroutine_function(self):
+        self.assertTrue(asyncio.iscoroutinefunction(async_role_view))
+        self.assertTrue(asyncio.iscoroutinefunction(async_permission_view))
+
+    async def test_has_allowed_role_to_view(self):
+        await aassign_role(self.user, DecRole1)
+
+        response = await async_role_view(self.request)
+
+        self.assertEqual(response.status_code, 200)
+
+    async def test_does_not_have_allowed_role_to_view(self):
+        with self.assertRaises(PermissionDenied):
+            await async_role_view(self.request)
+
+    async def test_permission_denied_redirects(self):
+        await aassign_role(self.user, DecRole1)
+
+        response = await async_permission_view(self.request)
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, '/denied/')
+
+    async def test_has_permission_to_view(self):
+        await aassign_role(self.user, DecRole2)
+
+        response = await async_permission_view(self.request)
+
+        self.assertEqual(response.status_code, 200)
+
+
+class CompiledPolicyTests(TestCase):
+
+    def setUp(self):
+        self.user = mommy.make(get_user_model())
+
+        self.request = RequestFactory().get('/')
+        self.request.session = {}
+        self.request.user = self.user
+
+    def test_unknown_role_fails_when_decorating(self):
+        with self.assertRaises(RoleDoesNotExist):
+            has_role_decorator(['dec_role1', 'dec_unknown_role'])
+
+    def test_roles_are_normalized_once(self):
+        decorator = has_role_decorator(['dec_role1', DecRole2])
+
+        self.assertEqual(frozenset([DecRole1, DecRole2]), decorator.roles)
+
+    def test_permission_bit_is_compiled(self):
+        decorator = has_permission_decorator('permission2')
+
+        self.assertEqual(RolesManager.get_registry().permission_bits['permission2'], decorator.bit)
+
+    def test_permission_registered_later(self):
+        view = has_permission_decorator('dec_later_permission')(lambda request: HttpResponse("Test"))
+
+        class DecLaterRole(AbstractUserRole):
+            available_permissions = {
+                'dec_later_permission': True,
+            }
+
+        DecLaterRole.assign_role_to_user(self.user)
+
+        self.assertEqual(view(self.request).status_code, 200)
+
+    def test_decorator_can_be_reused(self):
+        decorator = has_role_decorator('dec_role1')
+        first_view = decorator(lambda request: HttpResponse("first"))
+        second_view = decorator(lambda request: HttpResponse("second"))
+        DecRole1.assign_role_to_user(self.user)
+
+        self.assertEqual(b"first", first_view(self.request).content)
+        self.assertEqual(b"second", second_view(self.request).content)
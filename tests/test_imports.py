@@ -0,0 +1,80 @@
+import os
+import subprocess
+import sys
+
+from django.test import SimpleTestCase
+
+
+IMPORT_SCRIPT = """
+import sys
+import django
+from django.conf import settings
+
+settings.configure(
+    INSTALLED_APPS=['django.contrib.auth', 'django.contrib.contenttypes'],
+    DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}},
+)
+django.setup()
+sys.stderr.write('%s\\n')
+import %s
+"""
+MARKER = '-- rolepermissions --'
+
+# Cumulative import time of each public module, on top of a configured Django, in microseconds.
+IMPORT_BUDGET = 150000
+
+# Modules that would only be needed on rare code paths, or by the admin.
+HEAVY_MODULES = [
+    'django.contrib.admin',
+    'django.contrib.auth.views',
+    'django.contrib.auth.forms',
+    'django.forms',
+    'django.shortcuts',
+    'django.template.loader',
+    'django.views',
+    'pydoc',
+]
+
+PUBLIC_MODULES = [
+    'rolepermissions.cache',
+    'rolepermissions.checkers',
+    'rolepermissions.decorators',
+    'rolepermissions.exceptions',
+    'rolepermissions.loader',
+    'rolepermissions.middleware',
+    'rolepermissions.mixins',
+    'rolepermissions.permissions',
+    'rolepermissions.profiling',
+    'rolepermissions.querysets',
+    'rolepermissions.roles',
+    'rolepermissions.utils',
+]
+
+
+def measure_import(module):
+    """Import a module in a new interpreter and get ``{module: cumulative microseconds}`` for what it imported."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', IMPORT_SCRIPT % (MARKER, module)],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+
+    timings = {}
+    for line in result.stderr.split(MARKER, 1)[1].splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _self, cumulative, name = line[len('import time:'):].split('|')
+            if cumulative.strip().isdigit():
+                timings[name.strip()] = int(cumulative)
+
+    return timings
+
+
+class ImportTimeTests(SimpleTestCase):
+
+    def test_public_modules_import_budget(self):
+        for module in PUBLIC_MODULES:
+            with self.subTest(module=module):
+                timings = measure_import(module)
+
+                self.assertLessEqual(timings[module], IMPORT_BUDGET)
+                for heavy_module in HEAVY_MODULES:
+                    self.assertNotIn(heavy_module, timings)
@@ -0,0 +1,57 @@
+import sys
+from io import StringIO
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.core.management import call_command
+
+from rolepermissions import loader
+
+
+class DiscoverModulesTests(TestCase):
+
+    @override_settings(ROLEPERMISSIONS_MODULE='tests.mock_urls')
+    def test_role_module_comes_first(self):
+        self.assertEqual('tests.mock_urls', loader.discover_modules()[0])
+
+    def test_only_apps_with_permissions_module(self):
+        def has_permissions_module(module, name):
+            return module.__name__ == 'django.contrib.auth'
+
+        with patch('rolepermissions.loader.module_has_submodule', side_effect=has_permissions_module):
+            self.assertListEqual(['django.contrib.auth.permissions'], loader.discover_modules())
+
+    def test_rolepermissions_is_skipped(self):
+        with patch('rolepermissions.loader.module_has_submodule', return_value=True):
+            modules = loader.discover_modules()
+
+        self.assertNotIn('rolepermissions.permissions', modules)
+        self.assertIn('django.contrib.admin.permissions', modules)
+
+
+class LoadRolesAndPermissionsTests(TestCase):
+
+    def tearDown(self):
+        loader.load_roles_and_permissions()
+
+    @override_settings(ROLEPERMISSIONS_MODULES=['tests.mock_urls'])
+    def test_explicit_modules_skip_discovery(self):
+        sys.modules.pop('tests.mock_urls', None)
+
+        with patch('rolepermissions.loader.discover_modules') as discover_modules:
+            loader.load_roles_and_permissions()
+
+        self.assertFalse(discover_modules.called)
+        self.assertIn('tests.mock_urls', sys.modules)
+        self.assertListEqual(['tests.mock_urls'], [module for module, _elapsed in loader.get_import_timings()])
+
+    @override_settings(ROLEPERMISSIONS_MODULES=['tests.mock_urls'])
+    def test_modules_command(self):
+        loader.load_roles_and_permissions()
+        out = StringIO()
+
+        call_command('rolepermissions_modules', stdout=out)
+
+        self.assertIn('Imported 1 modules in', out.getvalue())
+        self.assertIn('ms  tests.mock_urls', out.getvalue())
+        self.assertIn('ROLEPERMISSIONS_MODULES = [\n]', out.getvalue())
@@ -0,0 +1,155 @@
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.http.response import HttpResponse
+from django.test.client import RequestFactory
+from django.utils.functional import SimpleLazyObject
+
+from model_mommy import mommy
+
+from rolepermissions.roles import AbstractUserRole, assign_role
+from rolepermissions.checkers import has_role, has_permission, ahas_role, ahas_permission
+from rolepermissions.middleware import RolePermissionsMiddleware, PermissionCheckTrackingMiddleware
+
+
+class MidRole1(AbstractUserRole):
+    available_permissions = {
+        'mid_permission1': True,
+        'mid_permission2': False,
+    }
+
+
+class MidRole2(AbstractUserRole):
+    available_permissions = {
+        'mid_permission3': True,
+    }
+
+
+class RolePermissionsMiddlewareTests(TestCase):
+
+    def setUp(self):
+        self.user = mommy.make(get_user_model())
+        assign_role(self.user, MidRole1)
+        self.results = []
+
+    def make_request(self):
+        request = RequestFactory().get('/')
+        request.user = SimpleLazyObject(lambda: get_user_model().objects.get(pk=self.user.pk))
+        return request
+
+    def checking_view(self, request):
+        for i in range(3):
+            self.results.append(has_role(request.user, MidRole1))
+            self.results.append(has_permission(request.user, 'mid_permission1'))
+            self.results.append(has_permission(request.user, 'mid_permission3'))
+        return HttpResponse("Test")
+
+    def test_checks_share_a_single_query(self):
+        middleware = RolePermissionsMiddleware(self.checking_view)
+
+        with self.assertNumQueries(2):  # the user, then its groups and permissions together
+            middleware(self.make_request())
+
+        self.assertListEqual([True, True, False] * 3, self.results)
+
+    def test_requests_without_checks_cost_nothing(self):
+        middleware = RolePermissionsMiddleware(lambda request: HttpResponse("Test"))
+
+        with self.assertNumQueries(0):
+            middleware(self.make_request())
+
+    def test_changes_during_the_request_are_seen(self):
+        def view(request):
+            self.results.append(has_role(request.user, MidRole2))
+            assign_role(request.user, MidRole2)
+            self.results.append(has_role(request.user, MidRole2))
+            return HttpResponse("Test")
+
+        RolePermissionsMiddleware(view)(self.make_request())
+
+        self.assertListEqual([False, True], self.results)
+
+    def test_anonymous_user(self):
+        request = RequestFactory().get('/')
+        request.user = SimpleLazyObject(lambda: None)
+
+        def view(request):
+            self.results.append(has_role(request.user, MidRole1))
+            return HttpResponse("Test")
+
+        RolePermissionsMiddleware(view)(request)
+
+        self.assertListEqual([False], self.results)
+
+    @override_settings(ROLEPERMISSIONS_CACHE='default')
+    def test_uses_the_shared_cache(self):
+        cache.clear()
+        middleware = RolePermissionsMiddleware(self.checking_view)
+        with self.captureOnCommitCallbacks(execute=True):
+            middleware(self.make_request())
+
+        with self.assertNumQueries(1):  # the user
+            middleware(self.make_request())
+
+    async def test_async_view(self):
+        async def view(request):
+            self.results.append(await ahas_role(request.user, MidRole1))
+            self.results.append(await ahas_permission(request.user, 'mid_permission1'))
+            return HttpResponse("Test")
+
+        request = RequestFactory().get('/')
+        request.user = self.user
+
+        await RolePermissionsMiddleware(view)(request)
+
+        self.assertListEqual([True, True], self.results)
+
+
+class PermissionCheckTrackingMiddlewareTests(TestCase):
+
+    def setUp(self):
+        self.user = mommy.make(get_user_model())
+        assign_role(self.user, MidRole1)
+        self.trackers = []
+
+    def make_request(self):
+        request = RequestFactory().get('/tracked/')
+        request.user = get_user_model().objects.get(pk=self.user.pk)
+        return request
+
+    def checking_view(self, request):
+        self.trackers.append(request.permission_checks)
+        has_role(request.user, MidRole1)
+        has_permission(request.user, 'mid_permission1')
+        return HttpResponse("Test")
+
+    def test_records_the_checks_of_the_request(self):
+        with self.assertLogs('rolepermissions', 'DEBUG') as logs:
+            PermissionCheckTrackingMiddleware(self.checking_view)(self.make_request())
+
+        self.assertListEqual(['has_role', 'has_permission'], [call.function for call in self.trackers[0].calls])
+        self.assertEqual(['DEBUG'], [record.levelname for record in logs.records])
+        self.assertIn('GET /tracked/: 2 permission checks made 2 of 2 queries', logs.output[0])
+
+    @override_settings(ROLEPERMISSIONS_TRACKING_MAX_QUERIES=1)
+    def test_warns_over_the_budget(self):
+        with self.assertLogs('rolepermissions', 'WARNING'):
+            PermissionCheckTrackingMiddleware(self.checking_view)(self.make_request())
+
+    def test_requests_without_checks_are_not_logged(self):
+        with self.assertRaises(AssertionError):  # no logs
+            with self.assertLogs('rolepermissions', 'DEBUG'):
+                PermissionCheckTrackingMiddleware(lambda request: HttpResponse("Test"))(self.make_request())
+
+    async def test_async_view(self):
+        async def view(request):
+            self.trackers.append(request.permission_checks)
+            await ahas_role(request.user, MidRole1)
+            return HttpResponse("Test")
+
+        request = RequestFactory().get('/')
+        request.user = self.user
+
+        await PermissionCheckTrackingMiddleware(view)(request)
+
+        self.assertListEqual(['ahas_role'], [call.function for call in self.trackers[0].calls])
@@ -1,5 +1,8 @@
 
-from django.views.generic import DetailView
+from unittest import skipIf
+
+import django
+from django.views.generic import DetailView, View
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from django.test.client import RequestFactory
@@ -9,8 +12,9 @@ from django.test.utils import override_settings
 
 from model_mommy import mommy
 
-from rolepermissions.roles import RolesManager, AbstractUserRole
+from rolepermissions.roles import RolesManager, AbstractUserRole, aassign_role
 from rolepermissions.mixins import HasRoleMixin, HasPermissionsMixin
+from rolepermissions.exceptions import RoleDoesNotExist
 
 
 class MixRole1(AbstractUserRole):
@@ -179,3 +183,91 @@ class HasPermissionDecoratorTests(TestCase):
 
     def tearDown(self):
         RolesManager._roles = {}
+
+
+class AsyncHasRoleView(HasRoleMixin, View):
+    allowed_roles = ['mix_role1']
+
+    async def get(self, request, *args, **kwargs):
+        return HttpResponse("Test")
+
+
+class AsyncHasPermissionView(HasPermissionsMixin, View):
+    required_permission = 'permission3'
+
+    async def get(self, request, *args, **kwargs):
+        return HttpResponse("Test")
+
+
+@skipIf(django.VERSION < (4, 1), 'Async class based views need Django 4.1')
+class AsyncMixinTests(TestCase):
+
+    def setUp(self):
+        self.user = mommy.make(get_user_model())
+
+        self.request = RequestFactory().get('/')
+        self.request.session = {}
+        self.request.user = self.user
+
+    async def test_has_allowed_role_to_view(self):
+        await aassign_role(self.user, MixRole1)
+
+        response = await AsyncHasRoleView.as_view()(self.request)
+
+        self.assertEqual(response.status_code, 200)
+
+    async def test_does_not_have_allowed_role_to_view(self):
+        with self.assertRaises(PermissionDenied):
+            await AsyncHasRoleView.as_view()(self.request)
+
+    async def test_has_permission_to_view(self):
+        await aassign_role(self.user, MixRole2)
+
+        response = await AsyncHasPermissionView.as_view()(self.request)
+
+        self.assertEqual(response.status_code, 200)
+
+    async def test_permission_denied(self):
+        await aassign_role(self.user, MixRole1)
+
+        with self.assertRaises(PermissionDenied):
+            await AsyncHasPermissionView.as_view()(self.request)
+
+
+@override_settings(ROOT_URLCONF='tests.mock_urls')
+class CompiledPolicyTests(TestCase):
+
+    def setUp(self):
+        self.user = mommy.make(get_user_model())
+
+        self.request = RequestFactory().get('/')
+        self.request.session = {}
+        self.request.user = self.user
+
+    def test_unknown_role_fails_at_class_creation(self):
+        with self.assertRaises(RoleDoesNotExist):
+            class UnknownRoleView(HasRoleMixin, View):
+                allowed_roles = ['mix_unknown_role']
+
+    def test_policy_is_compiled_once(self):
+        self.assertEqual(frozenset([MixRole1, MixRole2]), MultipleHasRoleDetailView._role_policy.roles)
+        self.assertIs(MultipleHasRoleDetailView._role_policy, MultipleHasRoleDetailView().get_role_policy())
+
+    def test_as_view_attributes(self):
+        MixRole2.assign_role_to_user(self.user)
+        view = HasRoleDetailView.as_view(allowed_roles=[MixRole2])
+
+        self.assertEqual(view(self.request).status_code, 200)
+
+        with self.assertRaises(PermissionDenied):
+            HasRoleDetailView.as_view()(self.request)
+
+    def test_redirect_url(self):
+        class RedirectUrlView(HasPermissionsMixin, View):
+            required_permission = 'permission1'
+            redirect_url = '/denied/'
+
+        response = RedirectUrlView.as_view()(self.request)
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, '/denied/')
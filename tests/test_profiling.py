@@ -0,0 +1,199 @@
+from asgiref.sync import async_to_sync
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.http.response import HttpResponse
+from django.template import Context, Template
+from django.test.client import RequestFactory
+
+from model_mommy import mommy
+
+from rolepermissions.cache import SNAPSHOT_ATTR, LazyUserSnapshot
+from rolepermissions.decorators import has_role_decorator
+from rolepermissions.roles import AbstractUserRole, assign_role, aassign_role
+from rolepermissions.checkers import has_role, has_permission, ahas_role, filter_queryset_by_permission
+from rolepermissions.permissions import register_queryset_checker
+from rolepermissions.exceptions import QueryBudgetExceeded
+from rolepermissions.profiling import track_permission_checks
+
+
+class ProRole1(AbstractUserRole):
+    available_permissions = {
+        'pro_permission1': True,
+    }
+
+
+class ProRole2(AbstractUserRole):
+    available_permissions = {
+        'pro_permission2': True,
+    }
+
+
+@register_queryset_checker()
+def pro_queryset_checker(role, user):
+    return True
+
+
+@has_role_decorator(ProRole1)
+def pro_view(request):
+    has_permission(request.user, 'pro_permission1')
+    return HttpResponse()
+
+
+class TrackPermissionChecksTests(TestCase):
+
+    def setUp(self):
+        self.user = mommy.make(get_user_model())
+        assign_role(self.user, ProRole1)
+
+    def fetch_user(self, pk=None):
+        return get_user_model().objects.get(pk=pk or self.user.pk)
+
+    def test_records_calls(self):
+        user = self.fetch_user()
+
+        with track_permission_checks() as tracker:
+            has_role(user, ProRole1)
+            has_permission(user, 'pro_permission1')
+
+        first, second = tracker.calls
+        self.assertEqual('has_role', first.function)
+        self.assertEqual((user, ProRole1), first.args)
+        self.assertEqual(1, len(first.queries))
+        self.assertEqual(1, len(second.queries))
+        self.assertEqual((__file__, first.caller[1], 'test_records_calls'), first.caller)
+        self.assertGreater(first.duration, 0)
+        self.assertEqual(2, tracker.query_count)
+
+    def test_counts_other_queries_separately(self):
+        with track_permission_checks() as tracker:
+            has_role(self.fetch_user(), ProRole1)
+
+        self.assertEqual(1, tracker.query_count)
+        self.assertEqual(2, tracker.total_queries)
+
+    def test_nested_calls_count_for_the_outermost_one(self):
+        user = self.fetch_user()
+
+        with track_permission_checks() as tracker:
+            assign_role(user, ProRole2)
+
+        self.assertListEqual(['assign_role'], [call.function for call in tracker.calls])
+        self.assertEqual(tracker.total_queries, tracker.query_count)
+
+    def test_nothing_is_recorded_outside_the_block(self):
+        with track_permission_checks() as tracker:
+            pass
+        has_role(self.user, ProRole1)
+
+        self.assertListEqual([], tracker.calls)
+
+    def test_duplicates(self):
+        user = self.fetch_user()
+
+        with track_permission_checks() as tracker:
+            has_role(user, ProRole1)
+            has_role(user, ProRole1)
+            has_role(user, ProRole2)
+
+        duplicates = tracker.duplicates()
+        self.assertEqual(1, len(duplicates))
+        call, count = duplicates[0]
+        self.assertEqual(2, count)
+        self.assertEqual("has_role(<auth.user %s>, ProRole1)" % user.pk, str(call))
+        self.assertIn('Duplicated checks:', tracker.summary())
+
+    def test_n_plus_one(self):
+        mommy.make(get_user_model(), _quantity=2)
+        users = list(get_user_model().objects.all())
+
+        with track_permission_checks() as tracker:
+            for user in users:
+                has_role(user, ProRole1)
+
+        self.assertListEqual([('has_role', tracker.calls[0].caller, 3, tracker.query_count)], tracker.n_plus_one())
+        self.assertEqual(__file__, tracker.calls[0].caller[0])
+        self.assertIn('N+1 patterns:', tracker.summary())
+
+    def test_n_plus_one_needs_queries_on_every_call(self):
+        user = self.fetch_user()
+
+        with track_permission_checks() as tracker:
+            for i in range(3):
+                has_role(user, ProRole1)
+
+        self.assertListEqual([], tracker.n_plus_one())
+        self.assertNotIn('N+1 patterns:', tracker.summary())
+
+    def test_query_budget(self):
+        with self.assertRaises(QueryBudgetExceeded) as context:
+            with track_permission_checks(max_queries=1):
+                has_permission(self.fetch_user(), 'pro_permission1')
+
+        self.assertIn('2 queries made by rolepermissions, the budget is 1', str(context.exception))
+
+        with track_permission_checks(max_queries=2):
+            has_permission(self.fetch_user(), 'pro_permission1')
+
+    def test_query_budget_does_not_hide_errors(self):
+        with self.assertRaises(KeyError):
+            with track_permission_checks(max_queries=0):
+                has_role(self.fetch_user(), ProRole1)
+                raise KeyError()
+
+    def test_arguments_are_described_without_queries(self):
+        queryset = get_user_model().objects.all()
+
+        with track_permission_checks() as tracker:
+            filter_queryset_by_permission('pro_queryset_checker', self.user, queryset)
+
+        with self.assertNumQueries(0):
+            description = str(tracker.calls[0])
+        self.assertTrue(description.startswith("filter_queryset_by_permission('pro_queryset_checker'"))
+
+    def test_async_calls(self):
+        user = self.fetch_user()
+
+        with track_permission_checks() as tracker:
+            self.assertTrue(async_to_sync(ahas_role)(user, ProRole1))
+            async_to_sync(aassign_role)(user, ProRole2)
+
+        self.assertListEqual(['ahas_role', 'aassign_role'], [call.function for call in tracker.calls])
+        self.assertEqual(2, len(tracker.calls[0].queries))
+        self.assertEqual(tracker.total_queries, tracker.query_count)
+
+    def test_decorated_views(self):
+        request = RequestFactory().get('/')
+        request.user = self.fetch_user()
+
+        with track_permission_checks() as tracker:
+            pro_view(request)
+
+        self.assertListEqual(
+            ['get_user_snapshot', 'has_permission'], [call.function for call in tracker.calls])
+        self.assertEqual(1, len(tracker.calls[0].queries))
+        self.assertEqual(1, len(tracker.calls[1].queries))
+        self.assertEqual(tracker.total_queries, tracker.query_count)
+
+    def test_lazy_snapshots(self):
+        user = self.fetch_user()
+        setattr(user, SNAPSHOT_ATTR, LazyUserSnapshot(user))
+        request = RequestFactory().get('/')
+        request.user = user
+
+        with track_permission_checks() as tracker:
+            pro_view(request)
+
+        self.assertListEqual(['get_user_snapshot', 'LazyUserSnapshot.load', 'has_permission'],
+                             [call.function for call in tracker.calls])
+        self.assertEqual(1, len(tracker.calls[1].queries))
+        self.assertEqual(tracker.total_queries, tracker.query_count)
+
+    def test_template_tags(self):
+        template = Template(
+            '{% load permission_tags %}{% load_user_permissions user as perms %}{{ perms|can:"pro_permission1" }}')
+
+        with track_permission_checks() as tracker:
+            self.assertEqual('True', template.render(Context({'user': self.fetch_user()})))
+
+        self.assertListEqual(['get_user_snapshot', 'UserSnapshot.load'], [call.function for call in tracker.calls])
+        self.assertEqual(2, tracker.query_count)
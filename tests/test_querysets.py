@@ -0,0 +1,94 @@
+from django.test import TestCase, override_settings
+from django.contrib.auth import get_user_model
+from django.db.models import QuerySet
+
+from model_mommy import mommy
+
+from rolepermissions.roles import AbstractUserRole, assign_role
+from rolepermissions.permissions import grant_permission, revoke_permission
+from rolepermissions.checkers import has_role, has_permission
+from rolepermissions.querysets import (
+    users_with_role, users_with_any_role, users_with_permission, RolePermissionsQuerySetMixin)
+
+
+class QueRole1(AbstractUserRole):
+    available_permissions = {
+        'que_permission1': True,
+        'que_permission2': False,
+    }
+
+
+class QueRole2(AbstractUserRole):
+    available_permissions = {
+        'que_permission2': True,
+        'que_permission3': True,
+    }
+
+
+class UserQuerySet(RolePermissionsQuerySetMixin, QuerySet):
+    pass
+
+
+class UserQuerySetTests(TestCase):
+
+    def setUp(self):
+        User = get_user_model()
+        self.role1_user = mommy.make(User)
+        assign_role(self.role1_user, QueRole1)
+        self.role2_user = mommy.make(User)
+        assign_role(self.role2_user, QueRole2)
+        revoke_permission(self.role2_user, 'que_permission3')
+        self.both_user = mommy.make(User)
+        assign_role(self.both_user, QueRole1)
+        assign_role(self.both_user, QueRole2)
+        self.no_role_user = mommy.make(User)
+        self.superuser = mommy.make(User, is_superuser=True)
+        self.users = [self.role1_user, self.role2_user, self.both_user, self.no_role_user, self.superuser]
+
+    def assert_users(self, expected, queryset):
+        self.assertSetEqual(set(user.pk for user in expected), set(queryset.values_list('pk', flat=True)))
+
+    def assert_matches_checker(self, checker, subject, queryset):
+        self.assert_users([user for user in self.users if checker(user, subject)], queryset)
+
+    def test_users_with_role(self):
+        self.assert_users([self.role1_user, self.both_user, self.superuser], users_with_role(QueRole1))
+        self.assert_matches_checker(has_role, 'que_role2', users_with_role('que_role2'))
+
+    def test_users_with_any_role(self):
+        self.assert_users([self.role1_user, self.role2_user, self.both_user, self.superuser],
+                          users_with_any_role([QueRole1, 'que_role2']))
+
+    def test_unknown_role(self):
+        self.assert_users([self.superuser], users_with_role('not_a_role'))
+
+    def test_users_with_permission(self):
+        grant_permission(self.role1_user, 'que_permission2')
+
+        for permission_name in ['que_permission1', 'que_permission2', 'que_permission3', 'not_a_permission']:
+            self.assert_matches_checker(has_permission, permission_name, users_with_permission(permission_name))
+
+    def test_permission_out_of_roles_scope(self):
+        self.role2_user.user_permissions.add(*QueRole1.get_default_true_permissions())
+
+        self.assertNotIn(self.role2_user, users_with_permission('que_permission1'))
+
+    @override_settings(ROLEPERMISSIONS_SUPERUSER_SUPERPOWERS=False)
+    def test_superuser_without_superpowers(self):
+        self.assert_users([self.role1_user, self.both_user], users_with_role(QueRole1))
+        self.assert_users([self.role2_user, self.both_user], users_with_permission('que_permission2'))
+        self.assert_users([], users_with_role('not_a_role'))
+
+    def test_single_query(self):
+        with self.assertNumQueries(1):
+            list(users_with_permission('que_permission1'))
+        with self.assertNumQueries(1):
+            list(users_with_any_role([QueRole1, QueRole2]))
+
+    def test_queryset_mixin(self):
+        queryset = UserQuerySet(get_user_model()).filter(is_superuser=False)
+
+        self.assert_users([self.role1_user, self.both_user], queryset.with_role(QueRole1))
+        self.assert_users([self.role1_user, self.role2_user, self.both_user],
+                          queryset.with_any_role([QueRole1, QueRole2]))
+        self.assert_users([self.role2_user, self.both_user], queryset.with_permission('que_permission2'))
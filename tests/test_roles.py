@@ -5,7 +5,7 @@ from django.contrib.auth.models import Group
 
 from model_mommy import mommy
 
-from rolepermissions.roles import RolesManager, AbstractUserRole, get_or_create_permission
+from rolepermissions.roles import RolesManager, RoleRegistry, AbstractUserRole, get_or_create_permission
 
 
 class RolRole1(AbstractUserRole):
@@ -177,6 +177,74 @@ class RolesManagerTests(TestCase):
         self.assertEquals(RolesManager.retrieve_role('rol_role2'), RolRole2)
 
 
+class RoleRegistryTests(TestCase):
+
+    def test_registry_contents(self):
+        registry = RolesManager.get_registry()
+
+        self.assertIs(registry.roles['rol_role2'], RolRole2)
+        self.assertEqual(registry.names[RolRole2], 'rol_role2')
+        self.assertEqual(registry.permissions[RolRole2], frozenset(['permission3', 'permission4']))
+        self.assertEqual(registry.default_true_permissions[RolRole2], frozenset(['permission3']))
+        self.assertIn(RolRole1, registry.roles_with_permission('permission1'))
+        self.assertNotIn(RolRole2, registry.roles_with_permission('permission1'))
+        self.assertEqual(registry.roles_with_permission('not_a_permission'), frozenset())
+
+    def test_permission_bits(self):
+        registry = RolesManager.get_registry()
+        bits = [registry.permission_bits[name] for name in ('permission1', 'permission2', 'permission3')]
+
+        self.assertEqual(3, len(set(bits)))
+        for bit in bits:
+            self.assertEqual(1, bin(bit).count('1'))
+        self.assertEqual(registry.role_masks[RolRole1], bits[0] | bits[1])
+        self.assertEqual(registry.mask(['permission1', 'not_a_permission']), bits[0])
+        self.assertEqual(registry.permission_names_from_mask(bits[0] | bits[2]),
+                         frozenset(['permission1', 'permission3']))
+
+    def test_registry_is_immutable(self):
+        registry = RolesManager.get_registry()
+
+        with self.assertRaises(TypeError):
+            registry.roles['rol_role1'] = RolRole2
+
+    def test_registry_is_reused(self):
+        self.assertIs(RolesManager.get_registry(), RolesManager.get_registry())
+
+    def test_registry_is_rebuilt_on_registration(self):
+        registry = RolesManager.get_registry()
+
+        class RolLateRole(AbstractUserRole):
+            available_permissions = {
+                'late_permission': True,
+            }
+
+        new_registry = RolesManager.get_registry()
+        self.assertIsNot(registry, new_registry)
+        self.assertEqual(registry.permission_bits['permission1'], new_registry.permission_bits['permission1'])
+        self.assertNotEqual(registry.fingerprint, new_registry.fingerprint)
+        self.assertIs(new_registry.roles['rol_late_role'], RolLateRole)
+        self.assertEqual(new_registry.roles_with_permission('late_permission'), frozenset([RolLateRole]))
+
+    def test_fingerprint_covers_role_scopes(self):
+        def make_registry(first_permissions, second_permissions):
+            return RoleRegistry({
+                'first': type(str('First'), (object,), {'available_permissions': first_permissions}),
+                'second': type(str('Second'), (object,), {'available_permissions': second_permissions}),
+            })
+
+        registry = make_registry({'permission1': True}, {'permission2': False})
+
+        self.assertEqual(registry.fingerprint,
+                         make_registry({'permission1': True}, {'permission2': False}).fingerprint)
+        self.assertNotEqual(registry.fingerprint,
+                            make_registry({'permission2': False}, {'permission1': True}).fingerprint)
+        self.assertNotEqual(registry.fingerprint,
+                            make_registry({'permission1': False}, {'permission2': False}).fingerprint)
+        self.assertNotEqual(registry.fingerprint,
+                            make_registry({'permission1': True, 'permission2': False}, {}).fingerprint)
+
+
 class GetOrCreatePermissionsTests(TestCase):
 
     def setUp(self):
@@ -8,7 +8,8 @@ from model_mommy import mommy
 from rolepermissions.roles import RolesManager, AbstractUserRole
 from rolepermissions.roles import (
     get_user_roles, retrieve_role,
-    assign_role, remove_role, clear_roles
+    assign_role, remove_role, clear_roles,
+    assign_role_bulk, remove_role_bulk, clear_roles_bulk
 )
 from rolepermissions.permissions import (
     grant_permission, revoke_permission,
@@ -81,6 +82,83 @@ class AssignRoleTests(TestCase):
         self.assertListEqual([ShoRole1, ShoRole2], get_user_roles(user))
 
 
+class AssignRoleBulkTests(TestCase):
+
+    def setUp(self):
+        self.users = mommy.make(get_user_model(), _quantity=5)
+
+    def test_assign_role_bulk(self):
+        assign_role_bulk(self.users, ShoRole1)
+
+        for user in self.users:
+            self.assertListEqual([ShoRole1], get_user_roles(user))
+            self.assertTrue(has_permission(user, 'permission1'))
+            self.assertTrue(has_permission(user, 'permission2'))
+
+    def test_assign_role_bulk_to_queryset(self):
+        assign_role_bulk(get_user_model().objects.all(), 'sho_role2')
+
+        for user in self.users:
+            self.assertListEqual([ShoRole2], get_user_roles(user))
+            self.assertTrue(has_permission(user, 'permission3'))
+            self.assertFalse(has_permission(user, 'permission4'))
+
+    def test_assign_role_bulk_to_primary_keys(self):
+        assign_role_bulk([user.pk for user in self.users], ShoRole1)
+
+        for user in self.users:
+            self.assertListEqual([ShoRole1], get_user_roles(user))
+
+    def test_assign_role_bulk_keeps_existing_roles(self):
+        user = self.users[0]
+        assign_role(user, ShoRole1)
+        assign_role(user, ShoRole2)
+
+        assign_role_bulk(self.users, ShoRole1)
+
+        self.assertListEqual([ShoRole1, ShoRole2], get_user_roles(user))
+        self.assertEqual(3, user.user_permissions.count())
+
+    def test_assign_role_bulk_restores_revoked_default_permissions(self):
+        user = self.users[0]
+        assign_role(user, ShoRole1)
+        revoke_permission(user, 'permission1')
+
+        assign_role_bulk([user.pk], ShoRole1)
+
+        self.assertTrue(has_permission(get_user_model().objects.get(pk=user.pk), 'permission1'))
+
+    def test_assign_role_bulk_invalidates_snapshots(self):
+        user = self.users[0]
+        self.assertFalse(has_permission(user, 'permission1'))
+
+        assign_role_bulk(self.users, ShoRole1)
+
+        self.assertTrue(has_permission(user, 'permission1'))
+
+    def test_assign_invalid_role_bulk(self):
+        with self.assertRaises(RoleDoesNotExist):
+            assign_role_bulk(self.users, 'no role')
+
+    def test_queries_do_not_depend_on_number_of_users(self):
+        assign_role_bulk([], ShoRole1)
+        more_users = mommy.make(get_user_model(), _quantity=20)
+
+        with self.assertNumQueries(4):  # group, permissions, and one insert per through table
+            assign_role_bulk(self.users, ShoRole1)
+        with self.assertNumQueries(4):
+            assign_role_bulk(more_users, ShoRole1)
+
+    def test_assign_role_bulk_in_batches(self):
+        assign_role_bulk([], ShoRole1)
+
+        with self.assertNumQueries(2 + 2 * 3):
+            assign_role_bulk(self.users, ShoRole1, batch_size=2)
+
+        for user in self.users:
+            self.assertListEqual([ShoRole1], get_user_roles(user))
+
+
 class RemoveRoleTests(TestCase):
     enter_surgery_room = "enter_surgery_room"
     operate = "operate"
@@ -380,6 +458,104 @@ class ClearRolesTests(TestCase):
         self.assertListEqual([], get_user_roles(user))
 
 
+class RemoveRoleBulkTests(TestCase):
+    """Bulk removal must end up exactly where removing roles user by user does."""
+    operate = RemoveRoleTests.operate
+    Doctor = RemoveRoleTests.Doctor
+    Surgeon = RemoveRoleTests.Surgeon
+    Anesthesiologist = RemoveRoleTests.Anesthesiologist
+
+    scenarios = [
+        ([Doctor, Surgeon], [], []),
+        ([Doctor, Surgeon], ['enter_surgery_room'], []),
+        ([Doctor, Surgeon], [], ['operate']),
+        ([Doctor, Surgeon, Anesthesiologist], [], []),
+        ([Doctor, Surgeon, Anesthesiologist], ['enter_surgery_room'], []),
+        ([Surgeon, ShoRole1], ['operate'], ['permission2']),
+        ([Anesthesiologist], [], ['operate']),
+        ([], [], []),
+    ]
+
+    def setUp(self):
+        self.user = mommy.make(get_user_model())
+
+    def make_users(self, roles, revoked, granted):
+        users = mommy.make(get_user_model(), _quantity=2)
+        for user in users:
+            for role in roles:
+                assign_role(user, role)
+            for permission in revoked:
+                revoke_permission(user, permission)
+            for permission in granted:
+                grant_permission(user, permission)
+        return users
+
+    def assert_same_state(self, user, expected_user):
+        self.assertListEqual(get_user_roles(expected_user), get_user_roles(user))
+        self.assertSetEqual(set(expected_user.user_permissions.values_list('codename', flat=True)),
+                            set(user.user_permissions.values_list('codename', flat=True)))
+
+    def test_remove_role_bulk_matches_remove_role(self):
+        for role in [self.Doctor, self.Surgeon, self.Anesthesiologist, ShoRole1]:
+            for roles, revoked, granted in self.scenarios:
+                user, expected_user = self.make_users(roles, revoked, granted)
+
+                remove_role(expected_user, role)
+                remove_role_bulk(get_user_model().objects.filter(pk=user.pk), role)
+
+                self.assert_same_state(user, expected_user)
+
+    def test_clear_roles_bulk_matches_clear_roles(self):
+        for roles, revoked, granted in self.scenarios:
+            user, expected_user = self.make_users(roles, revoked, granted)
+
+            clear_roles(expected_user)
+            clear_roles_bulk([user])
+
+            self.assert_same_state(user, expected_user)
+
+    def test_bulk_removal_keeps_other_groups(self):
+        user = self.user
+        other_group = mommy.make(Group)
+        user.groups.add(other_group)
+        assign_role(user, self.Doctor)
+        assign_role(user, self.Surgeon)
+
+        remove_role_bulk([user], self.Doctor)
+        clear_roles_bulk([user])
+
+        self.assertListEqual([other_group], list(user.groups.all()))
+
+    def test_remove_role_bulk_invalidates_snapshots(self):
+        user = self.user
+        assign_role(user, self.Surgeon)
+        self.assertTrue(has_permission(user, self.operate))
+
+        remove_role_bulk([user], self.Surgeon)
+
+        self.assertFalse(has_permission(user, self.operate))
+
+    def test_remove_invalid_role_bulk(self):
+        with self.assertRaises(RoleDoesNotExist):
+            remove_role_bulk([self.user], 'no role')
+
+    def test_queries_do_not_depend_on_number_of_users(self):
+        users = mommy.make(get_user_model(), _quantity=10)
+        for user in users:
+            assign_role(user, self.Doctor)
+            assign_role(user, self.Surgeon)
+
+        with self.assertNumQueries(5):
+            remove_role_bulk(users[:3], self.Surgeon)
+        with self.assertNumQueries(5):
+            remove_role_bulk(users[3:], self.Surgeon)
+
+        with self.assertNumQueries(4):
+            clear_roles_bulk(users[:3])
+        with self.assertNumQueries(4):
+            clear_roles_bulk(users[3:])
+
+
 class GetUserRoleTests(TestCase):
 
     def setUp(self):
@@ -6,7 +6,7 @@ from django.template import Context, Template
 from model_mommy import mommy
 
 from rolepermissions.roles import AbstractUserRole
-from rolepermissions.permissions import register_object_checker
+from rolepermissions.permissions import register_object_checker, register_batch_object_checker
 
 
 class TemRole1(AbstractUserRole):
@@ -166,3 +166,140 @@ class CanTagTests(BaseTagTestCase):
         output = ''
 
         self.tag_test(template, context, output)
+
+
+class LoadUserPermissionsTests(BaseTagTestCase):
+
+    def setUp(self):
+        self.user = mommy.make(get_user_model())
+
+        TemRole1.assign_role_to_user(self.user)
+
+    def test_filters_use_loaded_permissions(self):
+        template = (
+            '{% load_user_permissions user as perms %}'
+            '{% if perms|has_role:"tem_role2,tem_role1" %}role{% endif %}'
+            '{% if perms|has_role:"tem_role2" %}other role{% endif %}'
+            '{% if perms|can:"permission1" %} can{% endif %}'
+            '{% if perms|can:"permission3" %} other permission{% endif %}'
+            '{% if perms|can:"unknown_permission" %} unknown{% endif %}')
+
+        self.tag_test(template, {'user': self.user}, 'role can')
+
+    def test_loaded_once_per_render(self):
+        user = get_user_model().objects.get(pk=self.user.pk)
+        template = Template(
+            '{% load permission_tags %}{% load_user_permissions user as perms %}'
+            + '{% if perms|has_role:"tem_role1" %}a{% endif %}{% if perms|can:"permission2" %}b{% endif %}' * 20)
+
+        with self.assertNumQueries(2):
+            self.assertEqual('ab' * 20, template.render(Context({'user': user})))
+
+    def test_defaults_to_context_user(self):
+        template = '{% load_user_permissions as perms %}{% if perms|can:"permission1" %}passed{% endif %}'
+
+        self.tag_test(template, {'user': self.user}, 'passed')
+
+    def test_superuser_with_superpowers(self):
+        self.user.is_superuser = True
+        template = (
+            '{% load_user_permissions user as perms %}'
+            '{% if perms|has_role:"tem_role2" %}role{% endif %}{% if perms|can:"permission3" %} can{% endif %}')
+
+        self.tag_test(template, {'user': self.user}, 'role can')
+
+    def test_none_user(self):
+        template = '{% load_user_permissions user as perms %}{% if perms|can:"permission1" %}passed{% endif %}'
+
+        self.tag_test(template, {'user': None}, '')
+
+
+class PrefetchObjectPermissionsTests(BaseTagTestCase):
+
+    def setUp(self):
+        self.user = mommy.make(get_user_model())
+        self.calls = []
+
+        TemRole1.assign_role_to_user(self.user)
+
+        @register_object_checker()
+        def tem_even_checker(role, user, obj):
+            self.calls.append(obj)
+            return obj % 2 == 0
+
+    def test_loop_uses_precomputed_permissions(self):
+        template = (
+            '{% prefetch_object_permissions "tem_even_checker" objects as can_map %}'
+            '{% for obj in objects %}{% if can_map|can:obj %}{{ obj }}{% endif %}{% endfor %}'
+            '{% for obj in objects %}{% if can_map|can:obj %}{{ obj }}{% endif %}{% endfor %}')
+
+        self.tag_test(template, {'user': self.user, 'objects': [1, 2, 3, 4]}, '2424')
+        self.assertListEqual([1, 2, 3, 4], self.calls)
+
+    def test_roles_are_resolved_once(self):
+        user = get_user_model().objects.get(pk=self.user.pk)
+        template = Template(
+            '{% load permission_tags %}{% prefetch_object_permissions "tem_even_checker" objects as can_map %}'
+            '{% for obj in objects %}{% if can_map|can:obj %}x{% endif %}{% endfor %}')
+
+        with self.assertNumQueries(1):
+            self.assertEqual('x' * 10, template.render(Context({'user': user, 'objects': range(20)})))
+
+    def test_uses_batch_checker(self):
+        @register_batch_object_checker()
+        def tem_batch_checker(role, user, objects):
+            self.calls.append(list(objects))
+            return [obj > 2 for obj in objects]
+
+        template = (
+            '{% prefetch_object_permissions "tem_batch_checker" objects as can_map %}'
+            '{% for obj in objects %}{% if can_map|can:obj %}{{ obj }}{% endif %}{% endfor %}')
+
+        self.tag_test(template, {'user': self.user, 'objects': [1, 2, 3, 4]}, '34')
+        self.assertListEqual([[1, 2, 3, 4]], self.calls)
+
+    def test_explicit_user(self):
+        other_user = mommy.make(get_user_model(), is_superuser=True)
+        template = (
+            '{% prefetch_object_permissions "tem_even_checker" objects user=other_user as can_map %}'
+            '{% for obj in objects %}{% if can_map|can:obj %}{{ obj }}{% endif %}{% endfor %}')
+
+        self.tag_test(template, {'user': self.user, 'other_user': other_user, 'objects': [1, 2]}, '12')
+
+    def test_missing_objects(self):
+        template = (
+            '{% prefetch_object_permissions "tem_even_checker" objects as can_map %}'
+            '{% if can_map|can:1 %}passed{% endif %}')
+
+        self.tag_test(template, {'user': self.user}, '')
+
+    def test_no_user(self):
+        @register_object_checker()
+        def tem_user_checker(role, user, obj):
+            return user.pk is not None
+
+        template = (
+            '{% prefetch_object_permissions "tem_user_checker" objects as can_map %}'
+            '{% for obj in objects %}{% if can_map|can:obj %}{{ obj }}{% endif %}{% endfor %}')
+
+        self.tag_test(template, {'objects': [1, 2]}, '')
+
+    def test_unhashable_objects(self):
+        @register_object_checker()
+        def tem_row_checker(role, user, obj):
+            return obj['id'] > 1
+
+        @register_object_checker()
+        def tem_unsaved_checker(role, user, obj):
+            return obj.username == 'allowed'
+
+        unsaved_users = [get_user_model()(username='allowed'), get_user_model()(username='denied')]
+
+        self.tag_test(
+            '{% prefetch_object_permissions "tem_row_checker" objects as can_map %}'
+            '{% for obj in objects %}{% if can_map|can:obj %}{{ obj.id }}{% endif %}{% endfor %}',
+            {'user': self.user, 'objects': [{'id': 1}, {'id': 2}]}, '2')
+        self.tag_test(
+            '{% prefetch_object_permissions "tem_unsaved_checker" objects as can_map %}'
+            '{% for obj in objects %}{% if can_map|can:obj %}{{ obj.username }}{% endif %}{% endfor %}',
+            {'user': self.user, 'objects': unsaved_users}, 'allowed')
@@ -1,12 +1,21 @@
 
+from asgiref.sync import async_to_sync
 from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 
 from model_mommy import mommy
 
-from rolepermissions.roles import AbstractUserRole
-from rolepermissions.checkers import has_role, has_permission, has_object_permission
-from rolepermissions.permissions import register_object_checker
+from rolepermissions.roles import AbstractUserRole, aassign_role, aremove_role, aclear_roles
+from rolepermissions.checkers import (
+    has_role, has_permission, has_any_permission, has_all_permissions, has_object_permission,
+    object_permission_map, filter_objects_by_permission, filter_queryset_by_permission, ObjectPermissionMap,
+    ahas_role, ahas_permission, ahas_any_permission, ahas_all_permissions, ahas_object_permission)
+from rolepermissions.exceptions import CheckerNotRegistered
+from django.db.models import Q
+
+from rolepermissions.permissions import (
+    register_object_checker, register_batch_object_checker, register_queryset_checker,
+    agrant_permission, arevoke_permission)
 
 
 class VerRole1(AbstractUserRole):
@@ -123,7 +132,7 @@ class HasPermissionTests(TestCase):
     def test_queries_no_prefetch(self):
         fetched_user = get_user_model().objects.get(pk=self.user.pk)
         N = 3
-        with self.assertNumQueries(2 * N):  # Two query (fetch roles, fetch permissions) per call
+        with self.assertNumQueries(2):  # Roles and permissions are fetched once, then reused
             for i in range(N):
                 has_permission(fetched_user, 'permission1')
 
@@ -150,6 +159,43 @@ class HasPermissionTests(TestCase):
         self.assertFalse(has_permission(user, 'permission5'))
 
 
+class HasAnyAndAllPermissionsTests(TestCase):
+
+    def setUp(self):
+        self.user = mommy.make(get_user_model())
+
+        VerRole1.assign_role_to_user(self.user)
+        VerRole2.assign_role_to_user(self.user)
+
+    def test_has_any_permission(self):
+        self.assertTrue(has_any_permission(self.user, ['permission4', 'permission3']))
+        self.assertFalse(has_any_permission(self.user, ['permission4', 'permission5']))
+
+    def test_has_any_permission_with_unknown_permissions(self):
+        self.assertTrue(has_any_permission(self.user, ['not_a_permission', 'permission1']))
+        self.assertFalse(has_any_permission(self.user, ['not_a_permission']))
+        self.assertFalse(has_any_permission(self.user, []))
+
+    def test_has_all_permissions(self):
+        self.assertTrue(has_all_permissions(self.user, ['permission1', 'permission3']))
+        self.assertFalse(has_all_permissions(self.user, ['permission1', 'permission4']))
+        self.assertTrue(has_all_permissions(self.user, []))
+
+    def test_has_all_permissions_with_unknown_permissions(self):
+        self.assertFalse(has_all_permissions(self.user, ['permission1', 'not_a_permission']))
+
+    def test_none_user_param(self):
+        self.assertFalse(has_any_permission(None, ['permission1']))
+        self.assertFalse(has_all_permissions(None, ['permission1']))
+
+    def test_superuser_with_superpowers(self):
+        user = self.user
+        user.is_superuser = True
+
+        self.assertTrue(has_any_permission(user, ['permission5']))
+        self.assertTrue(has_all_permissions(user, ['permission5', 'permission6']))
+
+
 class HasObjectPermissionTests(TestCase):
 
     def setUp(self):
@@ -190,3 +236,205 @@ class HasObjectPermissionTests(TestCase):
 
         self.assertTrue(has_object_permission('obj_checker', user, True))
         self.assertFalse(has_object_permission('obj_checker', user, False))
+
+
+class ObjectPermissionBatchTests(TestCase):
+
+    def setUp(self):
+        self.user = mommy.make(get_user_model())
+
+        VerRole1.assign_role_to_user(self.user)
+        VerRole2.assign_role_to_user(self.user)
+        self.calls = []
+
+        @register_object_checker()
+        def ver_even_checker(role, user, obj):
+            self.calls.append((role, obj))
+            return obj % 2 == 0
+
+        @register_batch_object_checker()
+        def ver_batch_checker(role, user, objects):
+            self.calls.append((role, objects))
+            if role is VerRole1:
+                return [obj % 2 == 0 for obj in objects]
+            return [obj % 3 == 0 for obj in objects]
+
+    def test_filter_objects_by_permission(self):
+        self.assertListEqual([2, 4], filter_objects_by_permission('ver_even_checker', self.user, range(1, 6)))
+
+    def test_object_permission_map(self):
+        permissions = object_permission_map('ver_even_checker', self.user, [1, 2])
+
+        self.assertIsInstance(permissions, ObjectPermissionMap)
+        self.assertEqual('ver_even_checker', permissions.checker_name)
+        self.assertDictEqual({1: False, 2: True}, dict(permissions))
+
+    def test_object_permission_map_of_unhashable_objects(self):
+        @register_object_checker()
+        def ver_row_checker(role, user, obj):
+            return obj['id'] % 2 == 0
+
+        rows = [{'id': 1}, {'id': 2}]
+        permissions = object_permission_map('ver_row_checker', self.user, rows)
+
+        self.assertFalse(permissions[rows[0]])
+        self.assertTrue(permissions[rows[1]])
+        self.assertNotIn({'id': 2}, permissions)
+        self.assertListEqual(rows, list(permissions))
+
+    def test_object_permission_map_of_unsaved_instances(self):
+        @register_object_checker()
+        def ver_unsaved_checker(role, user, obj):
+            return obj.username == 'allowed'
+
+        allowed, denied = get_user_model()(username='allowed'), get_user_model()(username='denied')
+        permissions = object_permission_map('ver_unsaved_checker', self.user, [allowed, denied])
+
+        self.assertTrue(permissions[allowed])
+        self.assertFalse(permissions[denied])
+        self.assertNotIn(get_user_model()(username='allowed'), permissions)
+
+    def test_roles_are_resolved_once(self):
+        user = get_user_model().objects.get(pk=self.user.pk)
+
+        with self.assertNumQueries(1):
+            filter_objects_by_permission('ver_even_checker', user, range(20))
+
+    def test_batch_checker_gets_pending_objects(self):
+        self.assertListEqual([2, 3, 4, 6], filter_objects_by_permission('ver_batch_checker', self.user, range(1, 7)))
+        self.assertListEqual([(VerRole1, [1, 2, 3, 4, 5, 6]), (VerRole2, [1, 3, 5])], self.calls)
+
+    def test_has_object_permission_uses_batch_checker(self):
+        self.assertTrue(has_object_permission('ver_batch_checker', self.user, 3))
+        self.assertFalse(has_object_permission('ver_batch_checker', self.user, 5))
+
+    def test_empty_objects(self):
+        self.assertListEqual([], filter_objects_by_permission('ver_batch_checker', self.user, []))
+        self.assertListEqual([], self.calls)
+
+    def test_superuser_with_superpowers(self):
+        self.user.is_superuser = True
+
+        self.assertListEqual([1, 2], filter_objects_by_permission('ver_even_checker', self.user, [1, 2]))
+        self.assertListEqual([], self.calls)
+
+    def test_not_registered_checker(self):
+        with self.assertRaises(CheckerNotRegistered):
+            object_permission_map('ver_missing_checker', self.user, [1])
+
+
+class FilterQuerysetByPermissionTests(TestCase):
+
+    def setUp(self):
+        self.user = mommy.make(get_user_model())
+        self.other_users = mommy.make(get_user_model(), _quantity=3)
+
+        VerRole1.assign_role_to_user(self.user)
+
+        @register_queryset_checker()
+        def ver_user_checker(role, user):
+            if role is VerRole1:
+                return Q(pk=user.pk)
+            if role is VerRole2:
+                return Q(pk=self.other_users[0].pk)
+            if role is VerRole3:
+                return True
+            return False
+
+    def filter_users(self, user):
+        return set(filter_queryset_by_permission('ver_user_checker', user, get_user_model().objects.all()))
+
+    def test_filters_in_a_single_query(self):
+        user = get_user_model().objects.get(pk=self.user.pk)
+        queryset = filter_queryset_by_permission('ver_user_checker', user, get_user_model().objects.all())
+
+        with self.assertNumQueries(1):
+            self.assertSetEqual({self.user}, set(queryset))
+
+    def test_conditions_are_or_ed_across_roles(self):
+        VerRole2.assign_role_to_user(self.user)
+
+        self.assertSetEqual({self.user, self.other_users[0]}, self.filter_users(self.user))
+
+    def test_true_matches_everything(self):
+        VerRole3.assign_role_to_user(self.user)
+
+        self.assertEqual(4, len(self.filter_users(self.user)))
+
+    def test_user_without_roles(self):
+        self.assertSetEqual(set(), self.filter_users(self.other_users[1]))
+
+    def test_superuser_with_superpowers(self):
+        self.other_users[1].is_superuser = True
+
+        self.assertEqual(4, len(self.filter_users(self.other_users[1])))
+
+    def test_not_registered_checker(self):
+        with self.assertRaises(CheckerNotRegistered):
+            filter_queryset_by_permission('ver_missing_checker', self.user, get_user_model().objects.all())
+
+
+class AsyncCheckerTests(TestCase):
+
+    def setUp(self):
+        self.user = mommy.make(get_user_model())
+
+        VerRole1.assign_role_to_user(self.user)
+
+        @register_object_checker()
+        def ver_async_checker(role, user, obj):
+            return role is VerRole1 and obj
+
+    def fetch_user(self):
+        return get_user_model().objects.get(pk=self.user.pk)
+
+    async def test_ahas_role(self):
+        self.assertTrue(await ahas_role(self.user, VerRole1))
+        self.assertTrue(await ahas_role(self.user, ['ver_new_name', 'ver_role1']))
+        self.assertFalse(await ahas_role(self.user, VerRole2))
+        self.assertFalse(await ahas_role(None, VerRole1))
+
+    async def test_ahas_permission(self):
+        self.assertTrue(await ahas_permission(self.user, 'permission1'))
+        self.assertFalse(await ahas_permission(self.user, 'permission3'))
+        self.assertTrue(await ahas_any_permission(self.user, ['permission1', 'permission3']))
+        self.assertFalse(await ahas_all_permissions(self.user, ['permission1', 'permission3']))
+
+    async def test_ahas_object_permission(self):
+        self.assertTrue(await ahas_object_permission('ver_async_checker', self.user, True))
+        self.assertFalse(await ahas_object_permission('ver_async_checker', self.user, False))
+
+    def test_snapshot_is_loaded_with_async_queries(self):
+        user = self.fetch_user()
+
+        with self.assertNumQueries(2):
+            self.assertTrue(async_to_sync(ahas_permission)(user, 'permission2'))
+        with self.assertNumQueries(0):
+            self.assertTrue(has_role(user, VerRole1))
+
+    async def test_role_mutations(self):
+        user = self.user
+
+        await aassign_role(user, VerRole2)
+        self.assertTrue(await ahas_role(user, VerRole2))
+
+        await aremove_role(user, VerRole2)
+        self.assertFalse(await ahas_role(user, VerRole2))
+
+        self.assertListEqual([VerRole1], await aclear_roles(user))
+        self.assertFalse(await ahas_role(user, VerRole1))
+
+    async def test_permission_mutations(self):
+        user = self.user
+
+        await arevoke_permission(user, 'permission1')
+        self.assertFalse(await ahas_permission(user, 'permission1'))
+
+        await agrant_permission(user, 'permission1')
+        self.assertTrue(await ahas_permission(user, 'permission1'))
+
+    async def test_superuser_with_superpowers(self):
+        self.user.is_superuser = True
+
+        self.assertTrue(await ahas_role(self.user, VerRole2))
+        self.assertTrue(await ahas_permission(self.user, 'permission3'))